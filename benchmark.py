@@ -0,0 +1,271 @@
+"""
+Offline scaling benchmark for the dashboard.
+
+Generates seeded synthetic arrests shaped like the output of get_data() and runs the
+ingestion parser, the schema stage, preprocess, the count cube and every figure builder
+at several row counts. Each measurement runs in a fresh process and records wall time,
+peak RSS growth and serialized figure size. Results are compared against a stored
+baseline and regressions are flagged.
+
+    python benchmark.py                          # 50k, 500k and 5M rows
+    python benchmark.py --sizes 50000 --save-baseline
+    python benchmark.py --steps count_cube city_crime_type
+"""
+import argparse
+import hashlib
+import inspect
+import io
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import main
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench')
+DEFAULT_SIZES = [50000, 500000, 5000000]
+TOLERANCE = 0.25
+# differences below these floors are noise, not regressions
+MIN_SECONDS = 0.05
+MIN_RSS_BYTES = 8 * 1024 * 1024
+MIN_JSON_BYTES = 1024
+
+DATA_STEPS = ['decode_page', 'apply_schema', 'preprocess', 'count_cube']
+STEPS = DATA_STEPS + list(main.FIGURES) + ['age_plot']
+
+
+def zipf_choice(rng, labels, rows, exponent=1.1):
+    """
+    This function draws labels with a long-tailed frequency, the first label most often
+    :param rng: numpy Generator
+    :param labels: list of labels
+    :param rows: number of draws
+    :param exponent: how quickly frequencies fall off
+    :return: numpy object array
+    """
+    weights = 1.0 / np.arange(1, len(labels) + 1) ** exponent
+    return rng.choice(np.asarray(labels, dtype=object), rows, p=weights / weights.sum())
+
+
+def with_missing(rng, values, rate):
+    values = values.astype(object)
+    values[rng.random(len(values)) < rate] = None
+    return values
+
+
+def synthetic_arrests(rows, seed=0):
+    """
+    This function generates arrests with the columns and dtypes get_data() decodes, with
+    cardinalities and missing fields in the range of the real dataset
+    :param rows: number of arrests
+    :param seed: random seed
+    :return: DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    days = (pd.Timestamp('2024-12-31') - pd.Timestamp('1988-01-01')).days
+    dates = pd.Timestamp('1988-01-01') + pd.to_timedelta(np.sort(rng.integers(0, days, rows)), unit='D')
+    ages = rng.gamma(6.0, 5.0, rows) + 12
+    ages = np.where(rng.random(rows) < 0.01, np.nan, np.minimum(np.round(ages), 98))
+    crimes = ['CRIME %03d' % code for code in range(400)] + ['.']
+    cities = ['URBANA', 'CHAMPAIGN', 'SAVOY', 'RANTOUL', 'DANVILLE'] + ['CITY %03d' % code for code in range(600)]
+    data = pd.DataFrame({
+        'arrest_code': pd.array(['%08d' % code for code in range(rows)], dtype='str'),
+        'date_of_arrest': dates,
+        'year_of_arrest': pd.array(dates.year, dtype='Int16'),
+        'month_of_arrest': pd.array(dates.month, dtype='Int8'),
+        'arrest_type_descp': with_missing(rng, zipf_choice(rng, ['CUSTODY', 'SUMMONS', 'WARRANT', 'CITATION'], rows),
+                                          0.02),
+        'crime_code_desc': zipf_choice(rng, crimes, rows),
+        'age_at_arrest': ages,
+        'arrestee_sex': with_missing(rng, zipf_choice(rng, ['MALE', 'FEMALE', 'UNKNOWN'], rows, 2.0), 0.005),
+        'arrestee_race': with_missing(rng, zipf_choice(rng, ['BLACK', 'WHITE', 'HISPANIC', 'ASIAN', 'OTHER',
+                                                             'NATIVE AMERICAN', 'UNKNOWN'], rows, 1.5), 0.01),
+        'arrestee_home_city': with_missing(rng, zipf_choice(rng, cities, rows, 1.3), 0.03),
+        'arrest_res': zipf_choice(rng, ['RELEASED', 'JAIL', 'NOTICE TO APPEAR', 'BOND', 'JUVENILE RELEASE',
+                                        'TRANSFERRED', 'WARRANT SERVED', 'OTHER'], rows),
+        'crime_category_desc': zipf_choice(rng, ['CATEGORY %02d' % code for code in range(15)], rows),
+    })
+    return data.astype({col: 'str' for col in main.CATEGORY_COLUMNS})
+
+
+def inputs_hash():
+    """
+    This function hashes the code the prepared inputs come from: the generator, the
+    column names and the schema and cube code of main with the constants they read
+    :return: hex digest
+    """
+    source = ''.join(inspect.getsource(function) for function in [zipf_choice, with_missing, synthetic_arrests])
+    source += repr(main.COLUMNS) + main.source_closure(main.apply_schema, main.CountCube)
+    return hashlib.sha256(source.encode()).hexdigest()[:12]
+
+
+def prepare(rows, seed):
+    """
+    This function writes the inputs of every step for one size once, so that each
+    measured process only reads what its step consumes. Inputs are kept per hash of the
+    code that makes them, a change to it prepares them afresh.
+    :return: directory holding the inputs
+    """
+    directory = os.path.join(BENCH_DIR, 'data', '%d-%d-%s' % (rows, seed, inputs_hash()))
+    if os.path.exists(os.path.join(directory, 'cube')):
+        return directory
+    os.makedirs(directory, exist_ok=True)
+    data = synthetic_arrests(rows, seed)
+    source_names = {target: source for source, target in main.COLUMNS.items()}
+    data.rename(columns=source_names).to_csv(os.path.join(directory, 'page.csv'), index=False,
+                                             date_format='%Y-%m-%dT%H:%M:%S.000')
+    main.feather.write_feather(data, os.path.join(directory, 'decoded.arrow'))
+    data = main.apply_schema(data)
+    main.feather.write_feather(data, os.path.join(directory, 'schema.arrow'))
+    main.CountCube.from_data(data).write(os.path.join(directory, 'cube'))
+    return directory
+
+
+class PeakRss:
+    """
+    Context manager sampling the resident set size while its block runs and keeping the
+    growth of the peak over the starting value. Falls back to ru_maxrss without /proc,
+    and leaves delta None without either.
+    """
+
+    def __init__(self, interval=0.002):
+        self.interval = interval
+        self.delta = 0
+
+    def __enter__(self):
+        self.start = main.current_rss()
+        self.peak = self.start
+        self.start_maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource is not None else None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        if self.start is not None:
+            self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            self.peak = max(self.peak, main.current_rss())
+
+    def __exit__(self, *exc):
+        self._done.set()
+        if self.start is not None:
+            self._thread.join()
+            self.peak = max(self.peak, main.current_rss())
+            self.delta = self.peak - self.start
+        elif self.start_maxrss is None:
+            self.delta = None
+        else:
+            # ru_maxrss is kilobytes on Linux and bytes on macOS
+            scale = 1 if sys.platform == 'darwin' else 1024
+            self.delta = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - self.start_maxrss) * scale
+        return False
+
+
+def measure(step, directory):
+    """
+    This function runs one step on prepared inputs; it is the body of a fresh process
+    :return: dict of seconds, rss_bytes and json_bytes
+    """
+    def read(name):
+        return main.feather.read_table(os.path.join(directory, name)).to_pandas()
+
+    if step == 'decode_page':
+        with open(os.path.join(directory, 'page.csv'), 'rb') as f:
+            stream = io.BytesIO(f.read())
+        run = lambda: main.decode_page(stream)
+    elif step == 'apply_schema':
+        decoded = read('decoded.arrow')
+        run = lambda: main.apply_schema(decoded)
+    elif step == 'preprocess':
+        data = read('schema.arrow')
+        run = lambda: main.preprocess(data)
+    elif step == 'count_cube':
+        data = read('schema.arrow')
+        run = lambda: main.CountCube.from_data(data)
+    else:
+        cube = main.CountCube.read(os.path.join(directory, 'cube'))
+        builder = main.age_plot if step == 'age_plot' else main.FIGURES[step][1]
+        run = (lambda: builder(cube, None)) if step == 'age_plot' else (lambda: builder(cube))
+        # keep plotly's one-off import and validator setup out of the measurement
+        main.px.bar(pd.DataFrame({'x': [0], 'y': [0]}), x='x', y='y').to_json()
+    with PeakRss() as rss:
+        started = time.perf_counter()
+        result = run()
+        seconds = time.perf_counter() - started
+    json_bytes = len(result.to_json()) if hasattr(result, 'to_json') and step not in DATA_STEPS else None
+    return {'seconds': seconds, 'rss_bytes': rss.delta, 'json_bytes': json_bytes}
+
+
+def regressions(results, baseline, tolerance=TOLERANCE):
+    """
+    This function lists the metrics that grew past the tolerance and the noise floors
+    :param results: dict of 'rows:step' -> metrics
+    :param baseline: the same shape, from an earlier run
+    :return: list of messages
+    """
+    floors = {'seconds': MIN_SECONDS, 'rss_bytes': MIN_RSS_BYTES, 'json_bytes': MIN_JSON_BYTES}
+    found = []
+    for key, metrics in sorted(results.items()):
+        for metric, floor in floors.items():
+            old, new = baseline.get(key, {}).get(metric), metrics.get(metric)
+            if old is None or new is None:
+                continue
+            if new > old * (1 + tolerance) and new - old > floor:
+                found.append('%s %s: %.4g -> %.4g (+%.0f%%)' % (key, metric, old, new, 100.0 * (new - old) / max(old, 1e-9)))
+    return found
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description='Synthetic-data scaling benchmark for the dashboard')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='row counts to run')
+    parser.add_argument('--steps', nargs='+', default=STEPS, choices=STEPS, help='steps to run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--baseline', default=os.path.join(BENCH_DIR, 'baseline.json'))
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the new baseline')
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE)
+    args = parser.parse_args(argv)
+
+    if main.feather is None:
+        parser.error('the benchmark needs pyarrow')
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for rows in args.sizes:
+        directory = prepare(rows, args.seed)
+        for step in args.steps:
+            with context.Pool(1) as pool:
+                metrics = pool.apply(measure, (step, directory))
+            results['%d:%s' % (rows, step)] = metrics
+            print('%9d  %-18s %9.3fs  %8s MiB  %s' % (
+                rows, step, metrics['seconds'],
+                '?' if metrics['rss_bytes'] is None else '%.1f' % (metrics['rss_bytes'] / 2 ** 20),
+                '' if metrics['json_bytes'] is None else '%d B json' % metrics['json_bytes']))
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    with open(os.path.join(BENCH_DIR, 'results.json'), 'w') as f:
+        json.dump(results, f, indent=1, sort_keys=True)
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        return 0
+    if not os.path.exists(args.baseline):
+        print('no baseline at %s, run with --save-baseline to store one' % args.baseline)
+        return 0
+    with open(args.baseline) as f:
+        found = regressions(results, json.load(f), args.tolerance)
+    for message in found:
+        print('REGRESSION ' + message)
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
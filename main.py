@@ -1,314 +1,1746 @@
+import argparse
+import contextlib
+import functools
+import glob
+import gzip
+import hashlib
+import inspect
+import itertools
+import json
+import os
+import pickle
+import re
+import shutil
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from html import escape
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 import dash
 from dash import html
 from dash import dcc
+from dash.dependencies import Input, Output, State
+from flask import abort, g, request, send_file
+import plotly
 import plotly.express as px
+import plotly.offline
+import numpy as np
 import pandas as pd
 import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:
+    pa = feather = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
 
 app = dash.Dash()
 
+API_URL = 'https://data.urbanaillinois.us/resource/afbd-8beq.csv'
+# source column -> dashboard column, only the columns the figures read
+COLUMNS = {
+    'arrest_code': 'arrest_code',
+    'date_of_arrest': 'date_of_arrest',
+    'year_of_arrest': 'year_of_arrest',
+    'month_of_arrest': 'month_of_arrest',
+    'arrest_type_description': 'arrest_type_descp',
+    'crime_code_description': 'crime_code_desc',
+    'age_at_arrest': 'age_at_arrest',
+    'arrestee_sex': 'arrestee_sex',
+    'arrestee_race': 'arrestee_race',
+    'arrestee_home_city': 'arrestee_home_city',
+    'arrest_resolution': 'arrest_res',
+    'crime_category_description': 'crime_category_desc',
+}
+DTYPES = {
+    'arrest_code': str,
+    'year_of_arrest': 'Int16',
+    'month_of_arrest': 'Int8',
+    'age_at_arrest': 'float64',
+}
+DATE_COLUMNS = ['date_of_arrest']
+# low-cardinality text columns stored as pandas categoricals
+CATEGORY_COLUMNS = ['arrest_type_descp', 'crime_code_desc', 'arrestee_sex', 'arrestee_race',
+                    'arrestee_home_city', 'arrest_res', 'crime_category_desc']
+
+CACHE_DIR = os.environ.get('ARRESTS_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+CACHE_TTL = float(os.environ.get('ARRESTS_CACHE_TTL', 7 * 24 * 3600))
+OFFLINE = os.environ.get('ARRESTS_OFFLINE', '') not in ('', '0')
+SNAPSHOT_FILE = 'arrests.arrow'
+META_FILE = 'arrests.json'
+PAGE_SIZE = 10000
+MAX_WORKERS = 8
+MAX_RETRIES = 4
+RETRY_BACKOFF = 0.5
+REQUEST_TIMEOUT = 60
+
+# the cube keeps one table per grouping set the figures roll up from, ages reduced to
+# the classes between AGE_EDGES so that no table grows with the number of arrests
+CUBE_TABLES = [
+    ('year_of_arrest', 'arrest_type_descp'),
+    ('month_of_arrest', 'age_class'),
+    ('month_of_arrest', 'arrestee_sex'),
+    ('month_of_arrest', 'arrestee_race'),
+    ('arrest_res', 'age_class'),
+    ('crime_code_desc', 'arrest_type_descp'),
+    ('crime_code_desc', 'arrest_res'),
+    ('crime_code_desc', 'age_class'),
+    ('year_of_arrest', 'arrestee_home_city', 'arrestee_sex'),
+    ('year_of_arrest', 'arrestee_home_city', 'arrestee_race'),
+    ('year_of_arrest', 'arrestee_home_city', 'crime_code_desc'),
+    ('year_of_arrest', 'arrestee_home_city', 'age_class'),
+]
+CUBE_DIMENSIONS = sorted({dim for dims in CUBE_TABLES for dim in dims} - {'age_class'})
+# every bin edge an age figure uses; binned_ages only accepts bins drawn from these
+AGE_EDGES = [0, 13, 17, 18, 20, 24, 30, 34, 50, 54, 55, 74, 84, 99, 100, 110]
+MEASURES = ['count', 'age_sum', 'age_count']
+AGE_CATEGORY_BINS = [0, 18, 24, 34, 54, 74, 84, 100]
+AGE_CATEGORY_LABELS = ['0 to 18', '18 to 24', '24 to 34', '34 to 54', '54 to 74', '74 to 84', "84 to 100"]
+
+# columns the dashboard filters on; year_of_arrest is filtered by an inclusive range
+FILTER_COLUMNS = ['year_of_arrest', 'crime_category_desc', 'arrest_res', 'arrestee_sex', 'arrestee_race']
+RANGE_COLUMNS = ['year_of_arrest']
+FILTER_DROPDOWNS = [
+    ('crime_category_desc', 'Crime category'),
+    ('arrest_res', 'Arrest resolution'),
+    ('arrestee_sex', 'Sex'),
+    ('arrestee_race', 'Race'),
+]
+FILTERED_CUBES = 8
+STORE_POLL = float(os.environ.get('ARRESTS_STORE_POLL', 60))
+PREFETCH_FRAMES = 3
+PREFETCH_WORKERS = 2
+FIGURE_STORE_BYTES = int(os.environ.get('ARRESTS_FIGURE_STORE_BYTES', 512 * 1024 * 1024))
+
+FIGURE_CACHE_BYTES = int(os.environ.get('ARRESTS_FIGURE_CACHE_BYTES', 64 * 1024 * 1024))
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+BYTES_BUCKETS = tuple(1024 * 4 ** power for power in range(10))
+# directory for per-request collapsed stacks; profiling is off when it is empty
+PROFILE_DIR = os.environ.get('ARRESTS_PROFILE_DIR', '')
+PROFILE_INTERVAL = float(os.environ.get('ARRESTS_PROFILE_INTERVAL', 0.005))
+# seconds between resident set size samples while a pipeline stage runs
+RSS_INTERVAL = float(os.environ.get('ARRESTS_RSS_INTERVAL', 0.005))
+# sketch mode keeps bounded summaries and charts only the top values of long-tailed columns
+SKETCH_MODE = os.environ.get('ARRESTS_SKETCH', '') not in ('', '0')
+SKETCH_COLUMNS = ['crime_code_desc', 'arrestee_home_city']
+TOP_N = int(os.environ.get('ARRESTS_TOP_N', 20))
+SKETCH_CAPACITY = int(os.environ.get('ARRESTS_SKETCH_CAPACITY', 200))
+SKETCH_COMPRESSION = 100
+SKETCH_CHUNK_ROWS = 100000
+OTHER_LABEL = 'Other'
+HEADING_STYLE = {'textAlign': 'center', 'marginTop': 40, 'marginBottom': 40}
+LARGE_GRAPH_STYLE = {'width': 1500, 'height': 1000}
+
+
+def frame_slice(counts, dim, frame, x, y, color=None, stacked=False, log_y=False):
+    """
+    This function keeps a single animation frame of a rollup, or all of them. Plotly
+    express would work out the x and color category orders, the color of every value
+    and the y range from the rows it is given, so they are taken from the full rollup
+    instead and a single frame looks like that frame of the full animation.
+    :param counts: rollup DataFrame
+    :param dim: column the figure animates over
+    :param frame: value of dim to keep, None for the full animation
+    :param x: column on the x axis
+    :param y: column on the y axis
+    :param color: column the bars are colored by, if any
+    :param stacked: whether the bars at one x stack, so the range covers their sums
+    :param log_y: whether the y axis is logarithmic
+    :return: (counts, keyword arguments for plotly express)
+    """
+    orders = {x: list(pd.unique(counts[x].dropna()))}
+    heights = counts[y]
+    if color is not None:
+        orders[color] = list(pd.unique(counts[color].dropna()))
+    if stacked:
+        heights = counts.groupby([dim, x], observed=True)[y].sum()
+    top = heights.max() if len(heights) else 1
+    if log_y:
+        bottom = counts.loc[counts[y] > 0, y].min() if (counts[y] > 0).any() else 1
+        range_y = [bottom / 1.5, top * 1.5]
+    else:
+        range_y = [0, top * 1.05]
+    layout = {'category_orders': orders, 'range_y': range_y}
+    if color is not None:
+        template = plotly.io.templates[px.defaults.template or plotly.io.templates.default]
+        sequence = px.defaults.color_discrete_sequence or template.layout.colorway or px.colors.qualitative.D3
+        layout['color_discrete_map'] = {value: sequence[i % len(sequence)] for i, value in enumerate(orders[color])}
+    if frame is None:
+        return counts, dict(layout, animation_frame=dim)
+    return counts[counts[dim] == frame], dict(layout, animation_frame=None)
+
+
+def sketch_bounds(fig, cube, col, values):
+    """
+    This function writes the Space-Saving count bounds of every value of col under its
+    tick label in sketch mode, once per value rather than on every bar of every frame
+    :param fig: figure with col on the x axis
+    :param cube: CountCube
+    :param col: one of SKETCH_COLUMNS
+    :param values: x axis categories
+    :return: fig
+    """
+    if cube.sketches is None:
+        return fig
+    bounds = cube.sketches.bounds(col)
+    values = [value for value in values if value in bounds]
+    note = 'arrests over all time, Space-Saving bounds, * certainly top %d' % TOP_N
+    fig.update_xaxes(tickmode='array', tickvals=values,
+                     ticktext=['%s<br>%s' % (value, bounds[value]) for value in values],
+                     title_text='%s<br><sub>%s</sub>' % (fig.layout.xaxis.title.text or col, note))
+    return fig
+
 
-def yearwise_arrests(data):
+def yearwise_arrests(cube):
     """
     This function creates a plot of arrests made over the years
-    :param data:
+    :param cube: CountCube
     :return:
     """
-    yearwise_stats_count = data.groupby('year_of_arrest')[['arrest_code']].count()
-    yearwise_stats_count.reset_index(inplace=True)
+    yearwise_stats_count = cube.rollup(['year_of_arrest'])
     fig = px.line(yearwise_stats_count,
-                  x="year_of_arrest", y="arrest_code",
+                  x="year_of_arrest", y="count",
                   title='Yearwise arrests trend',
-                  labels={"year_of_arrest": "Year of Arrest", "arrest_code": "Number of Offenders"}
+                  labels={"year_of_arrest": "Year of Arrest", "count": "Number of Offenders"}
                   )
     return fig
 
 
-def case_res(data):
+def case_res(cube):
     """
     This function creates a plot of different arrest resolutions over the years
-    :param data:
+    :param cube: CountCube
     :return:
     """
-    plot_df = data.groupby('arrest_res')[['arrest_code']].count()
-    plot_df.reset_index(inplace=True)
-    plot_data = data.merge(plot_df, left_on="arrest_res", right_on="arrest_res", suffixes=("_ungrouped", "_grouped"))
-    fig = px.line(plot_data,
-                  x="arrest_res", y="arrest_code_grouped",
+    plot_df = cube.rollup(['arrest_res'])
+    fig = px.line(plot_df,
+                  x="arrest_res", y="count",
                   title='Yearwise arrests trend',
-                  labels={"arrest_res": "Arrest Resolution", "arrest_code": "Number of Offenders"}
+                  labels={"arrest_res": "Arrest Resolution", "count": "Number of Offenders"}
                   )
     return fig
 
 
 # %%
-def arrest_types(data):
+def arrest_types(cube, frame=None):
     """
     This fucntion creates a plot of number of offenders of each arrest type descriptions over the years
-    :param data:
+    :param cube: CountCube
+    :param frame: year to show on its own instead of animating every year
     :return:
     """
-    plot_df = data.groupby('arrest_type_descp')[['arrest_code']].count()
-    plot_df.reset_index(inplace=True)
-    plot_data = data.merge(plot_df, left_on="arrest_type_descp", right_on="arrest_type_descp",
-                           suffixes=("_ungrouped", "_grouped"))
-    fig = px.line(plot_data, x='arrest_type_descp', y='arrest_code_grouped',
-                  animation_frame="year_of_arrest")
+    plot_df = cube.rollup(['arrest_type_descp'])
+    plot_data = cube.rollup(['year_of_arrest', 'arrest_type_descp'])
+    plot_data = plot_data[['year_of_arrest', 'arrest_type_descp']].merge(plot_df, on="arrest_type_descp")
+    plot_data, frame_args = frame_slice(plot_data, 'year_of_arrest', frame, 'arrest_type_descp', 'count')
+    fig = px.line(plot_data, x='arrest_type_descp', y='count', **frame_args)
     return fig
 
 
-def age_plot(data, clause):
+def age_plot(cube, clause):
   """Plotting monthly average age at arrest"""
-  data['age_at_arrest'] = data['age_at_arrest'].astype(float)
-  yearwise_ageofarrests = data.groupby('year_of_arrest')['age_at_arrest'].mean().reset_index(name = 'Average Arrest Age')
+  yearwise_ageofarrests = cube.rollup(['year_of_arrest'])
+  yearwise_ageofarrests = yearwise_ageofarrests.assign(**{'Average Arrest Age': yearwise_ageofarrests['age_sum'] / yearwise_ageofarrests['age_count']})
   fig = px.line(yearwise_ageofarrests, x='year_of_arrest', y='Average Arrest Age', title = 'Average Age at Arrest by Month')
   return fig
 
 
-def monthly_arrests(data):
+def monthly_arrests(cube):
   """Plotting the monthly arrests by grouping by month and taking the count of arrests"""
-  num_arrests = data.groupby('month_of_arrest').size().reset_index(name="number_of_arrests")
+  num_arrests = cube.rollup(['month_of_arrest']).rename(columns={'count': 'number_of_arrests'})
   fig = px.bar(data_frame=num_arrests, x="month_of_arrest", y="number_of_arrests", barmode="group",
-                category_orders={"month_of_arrest": ["1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11", "12"]})
+                category_orders={"month_of_arrest": list(range(1, 13))})
   return fig
 
-def cat1_arrests(data):
+def cat1_arrests(cube, frame=None):
   """Plotting the number of arrests by binning age into 2 categories"""
   bins = [0.0, 18.0, 99.0]
   group_names = ['juvenile', 'non-juvenile']
-  data['age_at_arrest_cat'] = pd.cut(data['age_at_arrest'].astype(float), bins, labels=group_names)
-  age_group_juvenile = data.groupby(['age_at_arrest_cat', 'month_of_arrest']).size().reset_index(name="number_of_arrests")
+  age_group_juvenile = cube.binned_ages(['month_of_arrest'], 'age_at_arrest_cat', bins, group_names)
+  age_group_juvenile = age_group_juvenile.rename(columns={'count': 'number_of_arrests'})
+  age_group_juvenile, frame_args = frame_slice(age_group_juvenile, 'month_of_arrest', frame,
+                                               'age_at_arrest_cat', 'number_of_arrests')
   fig = px.bar(data_frame=age_group_juvenile, x="age_at_arrest_cat", y="number_of_arrests", barmode="group", 
-                title = 'Number of Juvenile/Non-Juvenile Arrests', animation_frame = 'month_of_arrest')
+                title = 'Number of Juvenile/Non-Juvenile Arrests', **frame_args)
   return fig
 
-def cat2_arrests(data):
+def cat2_arrests(cube, frame=None):
   """Plotting the number of arrests by binning age into 3 categories"""
-  data['age_at_arrest'] = data['age_at_arrest'].astype('float')
   bins = [0, 30, 50, 99]
   group_names = ['<=30', '30-50', '50-99']
-  data['age_at_arrest_cat2'] = pd.cut(data['age_at_arrest'], bins, labels=group_names)
-  age_group_cat2 = data.groupby(['age_at_arrest_cat2', 'month_of_arrest']).size().reset_index(
-      name="number_of_arrests")
+  age_group_cat2 = cube.binned_ages(['month_of_arrest'], 'age_at_arrest_cat2', bins, group_names)
+  age_group_cat2 = age_group_cat2.rename(columns={'count': 'number_of_arrests'})
+  age_group_cat2, frame_args = frame_slice(age_group_cat2, 'month_of_arrest', frame,
+                                           'age_at_arrest_cat2', 'number_of_arrests')
   fig = px.bar(data_frame=age_group_cat2, x="age_at_arrest_cat2", y="number_of_arrests", barmode="group",
-                title='Number of Arrests in each Age Group', animation_frame='month_of_arrest')
+                title='Number of Arrests in each Age Group', **frame_args)
   return fig
 
 
-def arrests_by_sex(data):
+def arrests_by_sex(cube, frame=None):
   """Plotting the number of arrests by sex"""
-  data_plot = data.loc[data['arrestee_sex'].isin(['MALE', 'FEMALE'])]
-  age_group_sex = data_plot.groupby(['arrestee_sex', 'month_of_arrest']).size().reset_index(name="number_of_arrests")
+  age_group_sex = cube.rollup(['arrestee_sex', 'month_of_arrest'])
+  age_group_sex = age_group_sex.loc[age_group_sex['arrestee_sex'].isin(['MALE', 'FEMALE'])]
+  age_group_sex = age_group_sex.rename(columns={'count': 'number_of_arrests'})
+  age_group_sex, frame_args = frame_slice(age_group_sex, 'month_of_arrest', frame, 'arrestee_sex', 'number_of_arrests')
   fig = px.bar(data_frame=age_group_sex, x="arrestee_sex", y="number_of_arrests", barmode="group",
-                title='Number of Arrests by sex', animation_frame='month_of_arrest')
+                title='Number of Arrests by sex', **frame_args)
   return fig
 
 
-def arrests_by_race(data):
+def arrests_by_race(cube, frame=None):
   """Plotting the number of arrests by race"""
-  data_plot = data.loc[~data['arrestee_race'].isin(['MALE', 'FEMALE'])]
-  age_group_race = data_plot.groupby(['arrestee_race', 'month_of_arrest']).size().reset_index(
-      name="number_of_arrests")
+  age_group_race = cube.rollup(['arrestee_race', 'month_of_arrest'])
+  age_group_race = age_group_race.loc[~age_group_race['arrestee_race'].isin(['MALE', 'FEMALE'])]
+  age_group_race = age_group_race.rename(columns={'count': 'number_of_arrests'})
+  age_group_race, frame_args = frame_slice(age_group_race, 'month_of_arrest', frame, 'arrestee_race',
+                                           'number_of_arrests')
   fig = px.bar(data_frame=age_group_race, x="arrestee_race", y="number_of_arrests", barmode="group",
-                title='Number of Arrests by race', animation_frame='month_of_arrest')
+                title='Number of Arrests by race', **frame_args)
   return fig
 
 
-def plot_fig3(data):
-    data_3 = data.groupby(['arrest_type_descp', 'crime_code_desc'])['arrest_code'].count().to_frame('no_of_arrests'). \
-        reset_index()
+def plot_fig3(cube):
+    data_3 = cube.rollup(['arrest_type_descp', 'crime_code_desc']).rename(columns={'count': 'no_of_arrests'})
     fig = px.bar(data_3, x="crime_code_desc", y="no_of_arrests", color='arrest_type_descp')
-    return fig
+    return sketch_bounds(fig, cube, 'crime_code_desc', data_3['crime_code_desc'].unique())
 
 
-def plot_fig2(data):
-    data_2 = data.groupby(['crime_code_desc', 'arrest_res'])['arrest_code'].count().to_frame('no_of_arrests'). \
-        reset_index()
+def plot_fig2(cube):
+    data_2 = cube.rollup(['crime_code_desc', 'arrest_res']).rename(columns={'count': 'no_of_arrests'})
     fig = px.bar(data_2, x="crime_code_desc", y="no_of_arrests", color='arrest_res')
-    return fig
+    return sketch_bounds(fig, cube, 'crime_code_desc', data_2['crime_code_desc'].unique())
 
 
-def plot_fig1(data):
-    data['year_of_arrest'] = pd.to_numeric(data['year_of_arrest'])
-    data['month_of_arrest'] = pd.to_numeric(data['month_of_arrest'])
-    data ['age_group'] = pd.cut(x = data['age_at_arrest'], bins=[0,17, 55, 99],
-                     labels=['Minor', 'Adult',
-                             'Elderly'])
-    data['age_at_arrest'] = pd.to_numeric(data['age_at_arrest'])
-    data_1 = data.groupby(['crime_code_desc', 'age_group'])['arrest_code'].count().to_frame('no_of_arrests').reset_index()
+def plot_fig1(cube):
+    data_1 = cube.binned_ages(['crime_code_desc'], 'age_group', bins=[0,17, 55, 99],
+                              labels=['Minor', 'Adult',
+                                      'Elderly'])
+    data_1 = data_1.rename(columns={'count': 'no_of_arrests'})
     fig = px.bar(data_1, x="crime_code_desc", y="no_of_arrests", color='age_group')
-    return fig
+    return sketch_bounds(fig, cube, 'crime_code_desc', data_1['crime_code_desc'].unique())
 
 
-def get_data():
-    response = requests.get('https://data.urbanaillinois.us/resource/afbd-8beq.json?$limit=50000').json()
-    arrest_code = []
-    incident_number = []
-    date_of_arrest = []
-    year_of_arrest = []
-    month_of_arrest = []
-    arrest_type_descp = []
-    crime_code = []
-    crime_code_desc = []
-    crime_category_code = []
-    crime_category_desc = []
-    violation = []
-    disposition_code = []
-    disposition_desc = []
-    age_at_arrest = []
-    arrestee_sex = []
-    arrestee_race = []
-    arrestee_emp_desc = []
-    arrestee_residency_desc = []
-    arrestee_home_zip = []
-    arrestee_home_city = []
-    arrestee_home_state = []
-    arrest_res = []
-
-    for i in response:
-        arrest_code.append(i['arrest_code'])
-        incident_number.append(i['incident_number'])
-        date_of_arrest.append(i['date_of_arrest'])
-        year_of_arrest.append(i['year_of_arrest'])
-        month_of_arrest.append(i['month_of_arrest'])
-        try:
-            arrest_type_descp.append(i['arrest_type_description'])
-        except:
-            arrest_type_descp.append(None)
-        crime_code.append(i['crime_code'])
-        crime_code_desc.append(i['crime_code_description'])
-        violation.append(i['violation'])
-        disposition_code.append(i['disposition_code'])
-        age_at_arrest.append(i['age_at_arrest'])
-        try:
-            arrestee_sex.append(i['arrestee_race'])
-        except:
-            arrestee_sex.append(None)
-        try:
-            arrestee_race.append(i['arrestee_sex'])
-        except:
-            arrestee_race.append(None)
-        try:
-            arrestee_emp_desc.append(i['arrestee_employment_description'])
-        except:
-            arrestee_emp_desc.append(None)
-        try:
-            arrestee_residency_desc.append(i['arrestee_residency_description'])
-        except:
-            arrestee_residency_desc.append(None)
-        try:
-            arrestee_home_zip.append(i['arrestee_home_zip'])
-        except:
-            arrestee_home_zip.append(None)
-        try:
-            arrestee_home_city.append(i['arrestee_home_city'])
-        except:
-            arrestee_home_city.append(None)
+class Metrics:
+    """
+    Thread-safe counters and histograms, rendered in the Prometheus text exposition
+    format. Every process keeps its own; a scrape sees the process that answered it.
+    """
+
+    def __init__(self):
+        self._counters = OrderedDict()
+        self._histograms = OrderedDict()
+        self._help = OrderedDict()
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self._histograms:
+                self._histograms[key] = (buckets, [0] * len(buckets), [0.0, 0])
+            bounds, counts, totals = self._histograms[key]
+            for position, bound in enumerate(bounds):
+                if value <= bound:
+                    counts[position] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def exposition(self):
+        """
+        This function renders every metric, grouped by name
+        :return: text/plain exposition
+        """
+        def series(name, labels, value):
+            text = ','.join('%s="%s"' % (label, str(content).replace('\\', '\\\\').replace('"', '\\"')
+                                         .replace('\n', '\\n')) for label, content in labels)
+            return '%s{%s} %s' % (name, text, repr(float(value))) if text else '%s %s' % (name, repr(float(value)))
+
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, (bounds, list(counts), list(totals)))
+                                for key, (bounds, counts, totals) in self._histograms.items())
+        lines = []
+        for name, (kind, text) in self._help.items():
+            lines += ['# HELP %s %s' % (name, text), '# TYPE %s %s' % (name, kind)]
+            for (metric, labels), value in counters:
+                if metric == name:
+                    lines.append(series(name, labels, value))
+            for (metric, labels), (bounds, counts, totals) in histograms:
+                if metric != name:
+                    continue
+                for bound, count in zip(bounds, counts):
+                    lines.append(series(name + '_bucket', labels + (('le', repr(float(bound))),), count))
+                lines.append(series(name + '_bucket', labels + (('le', '+Inf'),), totals[1]))
+                lines.append(series(name + '_sum', labels, totals[0]))
+                lines.append(series(name + '_count', labels, totals[1]))
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+metrics.describe('arrests_stage_seconds', 'histogram', 'Wall time of a pipeline stage')
+metrics.describe('arrests_stage_errors_total', 'counter', 'Pipeline stage calls that raised')
+metrics.describe('arrests_stage_rows_total', 'counter', 'Rows returned or consumed by a pipeline stage')
+metrics.describe('arrests_stage_peak_rss_growth_bytes_total', 'counter',
+                 'Growth of the resident set size to its sampled peak during a pipeline stage')
+metrics.describe('arrests_stage_bytes', 'histogram', 'Serialized size produced by a pipeline stage')
+metrics.describe('arrests_http_request_seconds', 'histogram', 'Wall time of an HTTP request by endpoint')
+metrics.describe('arrests_http_responses_total', 'counter', 'HTTP responses by endpoint and status')
+
+
+def current_rss():
+    """
+    This function reads the resident set size of this process
+    :return: bytes, or None where /proc is not available
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, AttributeError):
+        return None
+
+
+def peak_rss():
+    """
+    This function reads the lifetime peak resident set size of this process
+    :return: bytes, or None where the resource module is not available
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+class RssSampler:
+    """
+    One background thread sampling the resident set size every interval seconds while
+    any stage is open, keeping the highest sample of each open stage. Unlike the
+    lifetime peak of ru_maxrss, this shows the growth of stages that run after a bigger
+    one. Stages open at the same time share the process and see each other's memory.
+    """
+
+    def __init__(self, interval=RSS_INTERVAL):
+        self.interval = interval
+        self._peaks = {}
+        self._tokens = itertools.count()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        """
+        This function starts following a stage
+        :return: (token, resident set size now), or None without /proc
+        """
+        rss = current_rss()
+        if rss is None:
+            return None
+        with self._lock:
+            token = next(self._tokens)
+            self._peaks[token] = rss
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name='arrests-rss', daemon=True)
+                self._thread.start()
+        return token, rss
+
+    def close(self, token):
+        """
+        This function stops following a stage
+        :param token: token returned by open
+        :return: highest resident set size sampled while it was open
+        """
+        rss = current_rss() or 0
+        with self._lock:
+            return max(self._peaks.pop(token), rss)
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            rss = current_rss() or 0
+            with self._lock:
+                if not self._peaks:
+                    # the next open starts a new thread
+                    self._thread = None
+                    return
+                for token, peak in self._peaks.items():
+                    self._peaks[token] = max(peak, rss)
+
+
+rss_sampler = RssSampler()
+
+
+@contextlib.contextmanager
+def measured(stage, **labels):
+    """
+    This function records one run of a pipeline stage. The block may set 'rows' and
+    'bytes' on the yielded dict; a stage that raises is counted as an error.
+    :param stage: stage name
+    :param labels: extra labels, e.g. the figure name
+    """
+    sample = {}
+    started = time.perf_counter()
+    opened = rss_sampler.open()
+    peak = peak_rss() if opened is None else None
+    try:
+        yield sample
+    except dash.exceptions.PreventUpdate:
+        raise
+    except Exception:
+        metrics.inc('arrests_stage_errors_total', stage=stage, **labels)
+        raise
+    finally:
+        metrics.observe('arrests_stage_seconds', time.perf_counter() - started, stage=stage, **labels)
+        if opened is not None:
+            token, start = opened
+            metrics.inc('arrests_stage_peak_rss_growth_bytes_total', rss_sampler.close(token) - start,
+                        stage=stage, **labels)
+        elif peak is not None:
+            # without /proc only the growth of the lifetime peak is known
+            metrics.inc('arrests_stage_peak_rss_growth_bytes_total', peak_rss() - peak, stage=stage, **labels)
+        if sample.get('rows') is not None:
+            metrics.inc('arrests_stage_rows_total', sample['rows'], stage=stage, **labels)
+        if sample.get('bytes') is not None:
+            metrics.observe('arrests_stage_bytes', sample['bytes'], buckets=BYTES_BUCKETS, stage=stage, **labels)
+
+
+def instrumented(stage, **labels):
+    """
+    This decorator measures every call of a function as a pipeline stage, counting the
+    rows of a returned DataFrame
+    :param stage: stage name
+    :param labels: extra labels
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with measured(stage, **labels) as sample:
+                result = function(*args, **kwargs)
+                if isinstance(result, pd.DataFrame):
+                    sample['rows'] = len(result)
+                return result
+        return wrapper
+    return decorate
+
+
+def make_session(max_workers=MAX_WORKERS):
+    """
+    This function creates a requests session whose connection pool is large enough
+    for every page worker to keep its own keep-alive connection
+    :param max_workers: number of concurrent page requests
+    :return: requests.Session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+@instrumented('decode_page')
+def decode_page(stream):
+    """
+    This function parses one CSV page straight into typed columns. Columns missing from
+    the page come back as all-null columns instead of failing the load.
+    :param stream: file-like CSV body
+    :return: DataFrame with the dashboard column names
+    """
+    page = pd.read_csv(stream, dtype=DTYPES, parse_dates=DATE_COLUMNS)
+    page = page.reindex(columns=list(COLUMNS))
+    return page.rename(columns=COLUMNS)
+
+
+def request_csv(session, url, params, read, retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+    """
+    This function sends one API request and parses the CSV body, retrying with
+    exponential backoff on connection errors, bodies cut short and 429/5xx responses.
+    The body is read from the raw urllib3 stream, whose errors are raised as
+    requests.ConnectionError once the retries run out.
+    :param session: shared requests.Session
+    :param url: resource endpoint
+    :param params: SoQL query parameters
+    :param read: parser called with the raw response stream
+    :return: what read returns
+    """
+    for attempt in range(retries + 1):
         try:
-            arrestee_home_state.append(i['arrestee_home_state'])
-        except:
-            arrestee_home_state.append(None)
-        arrest_res.append(i['arrest_resolution'])
-
-        d = {'arrest_code': arrest_code, 'incident_number': incident_number, 'date_of_arrest': date_of_arrest,
-             'year_of_arrest': year_of_arrest,
-             'year_of_arrest': year_of_arrest, 'month_of_arrest': month_of_arrest,
-             'arrest_type_descp': arrest_type_descp, 'crime_code': crime_code,
-             'crime_code_desc': crime_code_desc, 'violation': violation, 'disposition_code': disposition_code,
-             'age_at_arrest': age_at_arrest,
-             'arrestee_sex': arrestee_sex, 'arrestee_race': arrestee_race, 'arrestee_emp_desc': arrestee_emp_desc,
-             'arrestee_residency_desc': arrestee_residency_desc,
-             'arrestee_home_zip': arrestee_home_zip, 'arrestee_home_city': arrestee_home_city,
-             'arrestee_home_state': arrestee_home_state, 'arrest_res': arrest_res}
-    data = pd.DataFrame(d)
+            with session.get(url, params=params, timeout=REQUEST_TIMEOUT, stream=True) as response:
+                if response.status_code != 429 and response.status_code < 500:
+                    response.raise_for_status()
+                    response.raw.decode_content = True
+                    return read(response.raw)
+                response.raise_for_status()
+        except (requests.ConnectionError, requests.Timeout, requests.HTTPError) as error:
+            status = getattr(error.response, 'status_code', None)
+            if attempt == retries or (status is not None and status != 429 and status < 500):
+                raise
+        except (urllib3.exceptions.ProtocolError, urllib3.exceptions.ReadTimeoutError,
+                requests.exceptions.ChunkedEncodingError) as error:
+            if attempt == retries:
+                raise requests.ConnectionError('response body cut short: %s' % error) from error
+        time.sleep(backoff * 2 ** attempt)
+
+
+@instrumented('fetch_page')
+def fetch_page(session, url, offset, limit, where=None, retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+    """
+    This function fetches and decodes one page of records
+    :param session: shared requests.Session
+    :param url: resource endpoint
+    :param offset: index of the first row of the page
+    :param limit: page size
+    :param where: optional SoQL filter
+    :return: DataFrame
+    """
+    params = {'$select': ','.join(COLUMNS), '$order': 'arrest_code', '$limit': limit, '$offset': offset}
+    if where:
+        params['$where'] = where
+    return request_csv(session, url, params, decode_page, retries, backoff)
+
+
+@instrumented('fetch_count')
+def fetch_count(session, url, where=None, retries=MAX_RETRIES, backoff=RETRY_BACKOFF):
+    """
+    This function asks the API how many records match
+    :param session: shared requests.Session
+    :param url: resource endpoint
+    :param where: optional SoQL filter
+    :return: int
+    """
+    params = {'$select': 'count(*) AS total'}
+    if where:
+        params['$where'] = where
+    return int(request_csv(session, url, params, pd.read_csv, retries, backoff)['total'].iloc[0])
+
+
+def fetch_records(url=API_URL, where=None, page_size=PAGE_SIZE, max_workers=MAX_WORKERS, consume=None):
+    """
+    This function pulls the whole dataset as $limit/$offset pages ordered on arrest_code.
+    The matching records are counted first and exactly the pages holding them are
+    requested on a thread pool sharing one pooled session, at most max_workers at a
+    time, and taken in offset order. Pages keep being requested one at a time after a
+    full last page, for records added since the count; the walk stops at the first
+    short page.
+    :param url: resource endpoint
+    :param where: optional SoQL filter applied to every page
+    :param page_size: rows per page
+    :param max_workers: pages in flight at once
+    :param consume: called with every page in offset order instead of keeping the pages
+    :return: list of page DataFrames, empty when consume is given
+    """
+    pages = []
+    consume = consume or pages.append
+    with make_session(max_workers) as session, ThreadPoolExecutor(max_workers=max_workers) as pool:
+        total = fetch_count(session, url, where)
+        offsets = iter(range(0, total, page_size))
+        in_flight = deque(pool.submit(fetch_page, session, url, offset, page_size, where)
+                          for offset in itertools.islice(offsets, max_workers))
+        fetched = 0
+        size = page_size
+        while in_flight:
+            page = in_flight.popleft().result()
+            offset = next(offsets, None)
+            if offset is not None:
+                in_flight.append(pool.submit(fetch_page, session, url, offset, page_size, where))
+            fetched, size = fetched + 1, len(page)
+            consume(page)
+        while size == page_size:
+            page = fetch_page(session, url, fetched * page_size, page_size, where)
+            fetched, size = fetched + 1, len(page)
+            consume(page)
+    return pages
+
+
+@instrumented('apply_schema')
+def apply_schema(data):
+    """
+    This function is the one place dtypes are decided: low-cardinality text becomes
+    categorical, ages become float32, years and months the smallest int that holds them
+    and the arrest date a datetime. Figure builders read the result and never coerce or
+    assign into it.
+    :param data: DataFrame from the decoder or the snapshot
+    :return: DataFrame
+    """
+    columns = {col: data[col].astype('category') for col in CATEGORY_COLUMNS}
+    columns['age_at_arrest'] = pd.to_numeric(data['age_at_arrest'], downcast='float')
+    for col in ['year_of_arrest', 'month_of_arrest']:
+        values = data[col]
+        columns[col] = values if values.isna().any() else pd.to_numeric(values.astype('int64'), downcast='integer')
+    columns['date_of_arrest'] = pd.to_datetime(data['date_of_arrest'])
+    return data.assign(**columns)
+
+
+def read_meta(cache_dir=CACHE_DIR):
+    """
+    This function reads the snapshot metadata, ignoring snapshots written for a
+    different column projection
+    :param cache_dir: snapshot directory
+    :return: dict or None
+    """
+    path = os.path.join(cache_dir, META_FILE)
+    if feather is None or not os.path.exists(path) or not os.path.exists(os.path.join(cache_dir, SNAPSHOT_FILE)):
+        return None
+    with open(path) as f:
+        meta = json.load(f)
+    if meta.get('columns') != list(COLUMNS.values()):
+        return None
+    return meta
+
+
+def segment_path(cache_dir, number):
+    return os.path.join(cache_dir, '%s-%s.arrow' % (os.path.splitext(SNAPSHOT_FILE)[0], number))
+
+
+def read_snapshot(cache_dir=CACHE_DIR):
+    """
+    This function memory-maps the Arrow IPC snapshot and applies the segments appended
+    to it since it was last written in full
+    :param cache_dir: snapshot directory
+    :return: DataFrame
+    """
+    table = feather.read_table(os.path.join(cache_dir, SNAPSHOT_FILE), memory_map=True)
+    data = table.to_pandas()
+    meta = read_meta(cache_dir) or {}
+    for number, segment in enumerate(meta.get('segments', []), 1):
+        rows = feather.read_table(segment_path(cache_dir, number), memory_map=True).to_pandas()
+        codes = data['arrest_code']
+        data = concat_categorical([data[~(codes.isin(rows['arrest_code']) | codes.isin(segment['deleted']))], rows])
     return data
 
 
-def city_sex(data):
-  data['year_of_arrest'] = data['year_of_arrest'].astype('int32')
-  data['month_of_arrest'] = pd.to_datetime(data['month_of_arrest'], format='%m')
-  data['date_of_arrest'] = pd.to_datetime(data['date_of_arrest'])
-  data_only_sex = data[(data['arrestee_sex'] == 'MALE') | (data['arrestee_sex'] == 'FEMALE')]
-  fig = px.histogram(data_only_sex, x = data_only_sex['arrestee_home_city'],
-                     y = data_only_sex['arrestee_home_city'].index,
-                     color = data_only_sex['arrestee_sex'],
-                     animation_frame=data_only_sex['year_of_arrest'],
-                     log_y = True,
-                     title = 'Relationship Between Offender Home City and Sex',
-                     labels = {'arrestee_home_city' : 'Offender Home City'})
-  return fig
+def write_snapshot(data, cache_dir=CACHE_DIR):
+    """
+    This function stores the dataset as an uncompressed Arrow IPC file (so it can be
+    memory-mapped on read) together with its high-water mark. Both files are replaced
+    atomically.
+    :param data: DataFrame
+    :param cache_dir: snapshot directory
+    :return: metadata dict
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, SNAPSHOT_FILE)
+    feather.write_feather(data.reset_index(drop=True), path + '.tmp', compression='uncompressed')
+    return replace_snapshot(path + '.tmp', list(data.columns), len(data), high_water_mark(data), cache_dir)
+
+
+def replace_snapshot(written, columns, rows, newest, cache_dir=CACHE_DIR):
+    """
+    This function moves a freshly written snapshot into place, records its metadata and
+    drops the segments of the snapshot it replaces
+    :param written: path of the new snapshot file
+    :param columns: its columns
+    :param rows: its number of rows
+    :param newest: its high-water mark
+    :param cache_dir: snapshot directory
+    :return: metadata dict
+    """
+    os.replace(written, os.path.join(cache_dir, SNAPSHOT_FILE))
+    meta = {
+        'columns': columns,
+        'rows': rows,
+        'high_water_mark': newest,
+        'fetched_at': time.time(),
+        'segments': [],
+    }
+    write_meta(meta, cache_dir)
+    for stale in glob.glob(segment_path(cache_dir, '*')):
+        os.remove(stale)
+    return meta
+
+
+@contextlib.contextmanager
+def snapshot_writer(cache_dir=CACHE_DIR):
+    """
+    This function writes the snapshot a page at a time, for loads that never hold the
+    whole dataset. The block gets a function taking decoded pages; the snapshot replaces
+    the old one only once the block completes.
+    :param cache_dir: snapshot directory
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.join(cache_dir, SNAPSHOT_FILE) + '.tmp'
+    types = {'date_of_arrest': pa.timestamp('ns'), 'year_of_arrest': pa.int16(), 'month_of_arrest': pa.int8(),
+             'age_at_arrest': pa.float64()}
+    schema = pa.schema([(col, types.get(col, pa.string())) for col in COLUMNS.values()])
+    written = {'rows': 0, 'newest': None}
+
+    def write(page):
+        page = page.assign(date_of_arrest=pd.to_datetime(page['date_of_arrest']))
+        page = page.astype({col: object for col in schema.names if col not in types})
+        writer.write_table(pa.Table.from_pandas(page, schema=schema, preserve_index=False))
+        newest = high_water_mark(page)
+        if newest is not None and (written['newest'] is None or newest > written['newest']):
+            written['newest'] = newest
+        written['rows'] += len(page)
+
+    with pa.ipc.new_file(path, schema) as writer:
+        yield write
+    replace_snapshot(path, schema.names, written['rows'], written['newest'], cache_dir)
+
+
+def iter_snapshot(cache_dir=CACHE_DIR, chunk_rows=SKETCH_CHUNK_ROWS):
+    """
+    This function reads the snapshot and its segments a chunk of rows at a time, leaving
+    out the rows a later segment revises or deletes
+    :param cache_dir: snapshot directory
+    :param chunk_rows: rows per chunk at most
+    :return: generator of DataFrames
+    """
+    segments = (read_meta(cache_dir) or {}).get('segments', [])
+    tables = [feather.read_table(os.path.join(cache_dir, SNAPSHOT_FILE), memory_map=True)]
+    tables += [feather.read_table(segment_path(cache_dir, number), memory_map=True)
+               for number in range(1, len(segments) + 1)]
+    # codes a segment brings or deletes replace every copy read before it
+    superseded = [set()]
+    for table, segment in zip(tables[:0:-1], segments[::-1]):
+        superseded.insert(0, superseded[0] | set(table.column('arrest_code').to_pylist()) | set(segment['deleted']))
+    for table, codes in zip(tables, superseded):
+        for batch in table.to_batches(max_chunksize=chunk_rows):
+            chunk = batch.to_pandas()
+            yield chunk[~chunk['arrest_code'].isin(codes)] if codes else chunk
+
+
+def append_snapshot(rows, deleted, data, cache_dir=CACHE_DIR):
+    """
+    This function stores a delta as a segment next to the snapshot, so that an update
+    writes the rows it brought rather than the whole dataset. Once the segments outgrow
+    a quarter of the snapshot the dataset is written in full again.
+    :param rows: new or revised rows after apply_schema
+    :param deleted: arrest codes removed
+    :param data: the whole dataset after the delta
+    :param cache_dir: snapshot directory
+    :return: metadata dict
+    """
+    meta = read_meta(cache_dir)
+    if meta is None:
+        return write_snapshot(data, cache_dir)
+    segments = meta.get('segments', [])
+    rows = rows.drop_duplicates('arrest_code', keep='last', ignore_index=True)
+    deleted = [str(code) for code in deleted]
+    pending = sum(segment['rows'] + len(segment['deleted']) for segment in segments) + len(rows) + len(deleted)
+    if pending * 4 > meta['rows']:
+        return write_snapshot(data, cache_dir)
+    path = segment_path(cache_dir, len(segments) + 1)
+    feather.write_feather(rows, path + '.tmp', compression='uncompressed')
+    os.replace(path + '.tmp', path)
+    newest = high_water_mark(rows)
+    if newest is None or (meta['high_water_mark'] is not None and newest < meta['high_water_mark']):
+        newest = meta['high_water_mark']
+    segments.append({'rows': len(rows), 'deleted': deleted})
+    return write_meta(dict(meta, high_water_mark=newest, fetched_at=time.time(), segments=segments), cache_dir)
+
+
+def high_water_mark(data):
+    """
+    This function formats the newest arrest date the way the API compares them
+    :param data: DataFrame after apply_schema
+    :return: str, or None without any dated row
+    """
+    newest = data['date_of_arrest'].max()
+    return None if pd.isna(newest) else newest.strftime('%Y-%m-%dT%H:%M:%S.000')
 
 
-def city_age(data):
-  data_age = data.dropna()
-  data_age['age_at_arrest'] = data_age['age_at_arrest'].astype(float)
+def write_meta(meta, cache_dir=CACHE_DIR):
+    """
+    This function atomically replaces the snapshot metadata
+    :param meta: metadata dict
+    :param cache_dir: snapshot directory
+    :return: meta
+    """
+    path = os.path.join(cache_dir, META_FILE)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + '.tmp', path)
+    return meta
+
+
+def refresh_data(data, meta, url=API_URL):
+    """
+    This function fetches only the rows at or after the stored high-water mark on
+    date_of_arrest and merges them in, keeping the newest copy of each arrest_code
+    :param data: cached DataFrame after apply_schema
+    :param meta: snapshot metadata, with a high-water mark
+    :param url: resource endpoint
+    :return: (merged DataFrame, fetched rows), both after apply_schema
+    """
+    where = "date_of_arrest >= '%s'" % meta['high_water_mark']
+    newer = apply_schema(pd.concat(fetch_records(url, where), ignore_index=True))
+    newer = newer.drop_duplicates('arrest_code', keep='last', ignore_index=True)
+    data = concat_categorical([data[~data['arrest_code'].isin(newer['arrest_code'])], newer])
+    return apply_schema(data), newer
+
+
+@instrumented('get_data')
+def get_data(url=API_URL, offline=OFFLINE, ttl=CACHE_TTL, cache_dir=CACHE_DIR):
+    """
+    This function loads the arrests dataset with only the columns the dashboard uses.
+    A fresh local snapshot is memory-mapped instead of hitting the API; a stale one is
+    topped up with the rows newer than its high-water mark, stored as a segment. Without
+    pyarrow every call goes to the network.
+    :param url: resource endpoint
+    :param offline: never touch the network, fail if there is no snapshot
+    :param ttl: seconds a snapshot stays fresh
+    :param cache_dir: snapshot directory
+    :return: DataFrame
+    """
+    meta = read_meta(cache_dir)
+    if meta is not None and (offline or time.time() - meta['fetched_at'] < ttl):
+        return apply_schema(read_snapshot(cache_dir))
+    if offline:
+        raise RuntimeError('No arrests snapshot in %s and offline mode is on' % cache_dir)
+    try:
+        if meta is not None and meta['high_water_mark'] is not None:
+            data, newer = refresh_data(apply_schema(read_snapshot(cache_dir)), meta, url)
+            append_snapshot(newer, (), data, cache_dir)
+            return data
+        data = apply_schema(pd.concat(fetch_records(url), ignore_index=True))
+    except requests.RequestException:
+        if meta is None:
+            raise
+        # keep serving the stale snapshot until the API is reachable again
+        return apply_schema(read_snapshot(cache_dir))
+    if feather is not None:
+        write_snapshot(data, cache_dir)
+    return data
+
+
+def concat_categorical(frames):
+    """
+    This function concatenates frames, keeping categorical columns categorical over the
+    sorted union of their categories where pd.concat would fall back to object
+    :param frames: list of DataFrames with the same columns
+    :return: DataFrame
+    """
+    dtypes = {}
+    for col in frames[0].columns:
+        if all(isinstance(frame[col].dtype, pd.CategoricalDtype) for frame in frames):
+            categories = frames[0][col].cat.categories
+            for frame in frames[1:]:
+                categories = categories.union(frame[col].cat.categories)
+            dtypes[col] = pd.CategoricalDtype(categories)
+    return pd.concat([frame.astype(dtypes) for frame in frames], ignore_index=True)
+
+
+def sum_measures(cells, dims):
+    """
+    This function adds up the measures of cells, retractions included, per combination
+    of dims, dropping missing keys and the combinations no arrest is left in
+    :param cells: DataFrame of dimension columns and the measures
+    :param dims: list of dimension columns
+    :return: DataFrame of dims plus count, age_sum and age_count
+    """
+    grouped = cells.groupby(list(dims), observed=True)[MEASURES].sum().reset_index()
+    grouped = grouped[grouped['count'] != 0].reset_index(drop=True)
+    # retracting every known age can leave float residue in the sum
+    grouped.loc[grouped['age_count'] == 0, 'age_sum'] = 0.0
+    return grouped
+
+
+def age_classes(ages):
+    """
+    This function codes ages by where they fall among AGE_EDGES: 2 * i + 1 for an age
+    equal to edge i, 2 * i for one strictly between edges i - 1 and i, -1 when missing
+    :param ages: Series of ages
+    :return: int8 numpy array
+    """
+    values = ages.to_numpy(dtype='float64', na_value=np.nan)
+    edges = np.asarray(AGE_EDGES, dtype='float64')
+    positions = np.searchsorted(edges, values, side='left')
+    on_edge = edges[np.minimum(positions, len(edges) - 1)] == values
+    codes = 2 * positions + on_edge
+    codes[np.isnan(values)] = -1
+    return codes.astype('int8')
+
+
+def age_class_values(codes):
+    """
+    This function maps age classes back to one age inside each class. Bins drawn from
+    AGE_EDGES put that age in the same bin as every other age of its class.
+    :param codes: age classes from age_classes
+    :return: float numpy array, NaN for missing ages
+    """
+    edges = np.asarray(AGE_EDGES, dtype='float64')
+    bounds = np.concatenate([[edges[0] - 1], edges, [edges[-1] + 1]])
+    values = np.empty(2 * len(edges) + 1)
+    values[0::2] = (bounds[:-1] + bounds[1:]) / 2
+    values[1::2] = edges
+    codes = np.asarray(codes)
+    return np.where(codes < 0, np.nan, values[np.clip(codes, 0, None)])
+
+
+class CountCube:
+    """
+    Arrest counts, age sums and age counts for every grouping set of CUBE_TABLES, with
+    ages reduced to their class among AGE_EDGES. Each table is bounded by the distinct
+    values of its own columns, and a rollup reads the smallest table holding its
+    dimensions, so figures cost the same however many arrests there are. Tables read
+    from Arrow files stay memory-mapped until a rollup first needs one. Setting reads to
+    a set records the dimensions of every rollup asked for.
+    """
+
+    def __init__(self, tables, sketches=None, hashes=None):
+        self.tables = tables
+        self.sketches = sketches
+        self.reads = None
+        self._hashes = hashes or {}
+        self._keys = {}
+        self._rollups = {}
+
+    def __len__(self):
+        return sum(len(table) for table in self.tables.values())
+
+    @classmethod
+    def from_data(cls, data):
+        """
+        This function aggregates the rows into every cube table. Missing dimension values
+        get their own cells so that no arrest is lost before a rollup decides to drop them.
+        :param data: DataFrame after apply_schema
+        :return: CountCube
+        """
+        # sum ages in float64, float32 loses whole years past a few million arrests
+        ages = data['age_at_arrest'].astype('float64').rename('age')
+        columns = data[CUBE_DIMENSIONS].assign(age=ages, age_class=age_classes(ages))
+        tables = {}
+        for dims in CUBE_TABLES:
+            tables[dims] = columns.groupby(list(dims), observed=True, dropna=False).agg(
+                count=('age', 'size'),
+                age_sum=('age', 'sum'),
+                age_count=('age', 'count'),
+            ).reset_index()
+        return cls(tables)
+
+    @classmethod
+    def read(cls, directory, sketches=None):
+        """
+        This function memory-maps a cube written by write without decoding any table
+        :param directory: directory holding one Arrow IPC file per table
+        :param sketches: Sketches of the cube in sketch mode
+        :return: CountCube
+        """
+        return cls({dims: feather.read_table(os.path.join(directory, '%s.arrow' % '.'.join(dims)), memory_map=True)
+                    for dims in CUBE_TABLES}, sketches)
+
+    def table(self, dims):
+        """
+        This function returns one table as a DataFrame, decoding a mapped Arrow table
+        the first time it is asked for
+        :param dims: key of tables
+        :return: DataFrame of dims and the measures
+        """
+        table = self.tables[dims]
+        if not isinstance(table, pd.DataFrame):
+            table = self.tables[dims] = table.to_pandas()
+        return table
+
+    def write(self, directory):
+        """
+        This function writes every table as an uncompressed Arrow IPC file
+        :param directory: created when missing
+        """
+        os.makedirs(directory, exist_ok=True)
+        for dims, table in self.tables.items():
+            feather.write_feather(table, os.path.join(directory, '%s.arrow' % '.'.join(dims)),
+                                  compression='uncompressed')
+
+    def rollup(self, dims):
+        """
+        This function marginalizes the smallest table holding dims onto them, dropping
+        missing keys the same way a groupby over the raw rows would. Rollups are memoized
+        and must be treated as read-only.
+        :param dims: list of dimension columns
+        :return: DataFrame of dims plus count, age_sum and age_count
+        """
+        key = tuple(dims)
+        if self.reads is not None:
+            self.reads.add(key)
+        if key not in self._rollups:
+            holding = [table for table in self.tables if set(dims) <= set(table)]
+            if not holding:
+                raise KeyError('no cube table holds %s' % ', '.join(dims))
+            smallest = min(holding, key=lambda table: len(self.tables[table]))
+            self._rollups[key] = sum_measures(self.table(smallest), dims)
+        return self._rollups[key]
+
+    def key_hashes(self, dims):
+        """
+        This function hashes the key of every cell of a table and indexes the hashes, once
+        per table and cube. A cube made by apply_delta inherits the hashes of its tables.
+        :param dims: key of tables
+        :return: (numpy array of uint64 hashes in table order, pd.Index of them)
+        """
+        if dims not in self._hashes:
+            self._hashes[dims] = pd.util.hash_pandas_object(self.table(dims)[list(dims)], index=False).to_numpy()
+        if dims not in self._keys:
+            self._keys[dims] = pd.Index(self._hashes[dims])
+        return self._hashes[dims], self._keys[dims]
+
+    def apply_delta(self, added, removed):
+        """
+        This function counts the rows of added in and the rows of removed (the previous
+        copies of revised or deleted arrests) out. The delta rows are keyed by the hash of
+        their cell in each table and summed per cell with bincount; cells already in the
+        table have their measures adjusted, new ones are appended and emptied ones dropped.
+        No table is grouped again, so the cost follows the delta rather than the history.
+        :param added: DataFrame after apply_schema
+        :param removed: DataFrame after apply_schema
+        :return: CountCube
+        """
+        if not len(added) and not len(removed):
+            return self
+        rows = concat_categorical([added[CUBE_DIMENSIONS + ['age_at_arrest']],
+                                   removed[CUBE_DIMENSIONS + ['age_at_arrest']]])
+        sign = np.repeat([1, -1], [len(added), len(removed)])
+        ages = rows['age_at_arrest'].astype('float64')
+        columns = rows[CUBE_DIMENSIONS].assign(age_class=age_classes(ages))
+        weights = {'count': sign, 'age_sum': sign * ages.fillna(0).to_numpy(),
+                   'age_count': sign * ages.notna().to_numpy()}
+        tables, hashes = {}, {}
+        for dims in self.tables:
+            cells = columns[list(dims)]
+            delta_hashes, first, inverse = np.unique(pd.util.hash_pandas_object(cells, index=False).to_numpy(),
+                                                     return_index=True, return_inverse=True)
+            sums = {measure: np.bincount(inverse, weights=values, minlength=len(delta_hashes))
+                    for measure, values in weights.items()}
+            known, keys = self.key_hashes(dims)
+            positions = keys.get_indexer(delta_hashes)
+            hit = positions >= 0
+            table = self.table(dims)
+            measures = {}
+            for measure in MEASURES:
+                values = table[measure].to_numpy().copy()
+                values[positions[hit]] += sums[measure][hit].astype(values.dtype)
+                measures[measure] = values
+            table = table.assign(**measures)
+            table_hashes = known
+            if not hit.all():
+                new = cells.iloc[first[~hit]].assign(**{measure: sums[measure][~hit].astype(table[measure].dtype)
+                                                        for measure in MEASURES})
+                table = concat_categorical([table, new])
+                table_hashes = np.concatenate([known, delta_hashes[~hit]])
+            kept = table['count'].to_numpy() != 0
+            if not kept.all():
+                table = table[kept].reset_index(drop=True)
+                table_hashes = table_hashes[kept]
+            tables[dims], hashes[dims] = table, table_hashes
+        return CountCube(tables, self.sketches, hashes)
+
+    def binned_ages(self, dims, name, bins, labels, right=True):
+        """
+        This function rolls the cube up onto dims plus an age bin column
+        :param dims: list of dimension columns
+        :param name: name of the age bin column
+        :param bins: bin edges passed to pd.cut, all of them in AGE_EDGES
+        :param labels: bin labels
+        :param right: whether bins include their right edge
+        :return: DataFrame of dims, name and the measures
+        """
+        if not set(bins) <= set(AGE_EDGES):
+            raise ValueError('age bins %s are not all in AGE_EDGES' % list(bins))
+        cells = self.rollup(list(dims) + ['age_class'])
+        ages = pd.Series(age_class_values(cells['age_class']), index=cells.index)
+        binned = pd.cut(ages, bins, labels=labels, right=right).rename(name)
+        grouped = cells.groupby([cells[dim] for dim in dims] + [binned], observed=True)[MEASURES].sum()
+        return grouped.reset_index()
+
+
+class TDigest:
+    """
+    Merging t-digest of a numeric column: sorted centroids that are narrow in the tails
+    and wide in the middle, at most about compression / 2 of them however many values
+    were added. Quantiles are interpolated between centroids.
+    """
+
+    def __init__(self, compression=SKETCH_COMPRESSION):
+        self.compression = compression
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self.min = np.inf
+        self.max = -np.inf
+
+    @property
+    def count(self):
+        return self.weights.sum()
+
+    def update(self, values):
+        """
+        This function adds a batch of values, ignoring NaN
+        :param values: numpy array
+        """
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.min = min(self.min, values.min())
+            self.max = max(self.max, values.max())
+            self._compress(np.concatenate([self.means, values]), np.concatenate([self.weights, np.ones(len(values))]))
+
+    def merge(self, other):
+        if len(other.means):
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind='stable')
+        means, weights = means[order], weights[order]
+        mids = (np.cumsum(weights) - weights / 2) / weights.sum()
+        # k1 scale function: points falling in the same unit of k share a centroid
+        k = np.floor(self.compression / (2 * np.pi) * np.arcsin(2 * mids - 1))
+        starts = np.flatnonzero(np.concatenate([[True], k[1:] != k[:-1]]))
+        self.weights = np.add.reduceat(weights, starts)
+        self.means = np.add.reduceat(means * weights, starts) / self.weights
+
+    def quantile(self, q):
+        """
+        This function estimates the q-quantile
+        :param q: float or numpy array in [0, 1]
+        :return: estimated value, NaN for an empty digest
+        """
+        if not len(self.means):
+            return np.nan * np.asarray(q)
+        ranks = np.cumsum(self.weights) - self.weights / 2
+        return np.interp(np.asarray(q) * self.count, np.concatenate([[0], ranks, [self.count]]),
+                         np.concatenate([[self.min], self.means, [self.max]]))
+
+    def quantile_bounds(self, q):
+        """
+        This function brackets the q-quantile. The ranks within the rank error of q, half a
+        unit of the scale function or pi * sqrt(q(1-q)) / compression, fall in a run of
+        centroids; values are only known to lie between the means of the centroids around
+        that run, so those means (or min and max at the ends) are the bounds. Interpolated
+        quantiles alone would miss the true one on tied values such as integer ages.
+        :param q: float in [0, 1]
+        :return: (low, estimate, high)
+        """
+        if not len(self.means):
+            return np.nan, np.nan, np.nan
+        error = np.pi * np.sqrt(q * (1 - q)) / self.compression
+        ends = np.cumsum(self.weights)
+        first, last = np.searchsorted(ends, np.clip([q - error, q + error], 0, 1) * self.count)
+        low = self.means[first - 1] if first > 0 else self.min
+        high = self.means[last + 1] if last + 1 < len(self.means) else self.max
+        return low, float(self.quantile(q)), high
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy hitters over at most capacity keys. Every tracked key has an
+    estimated count that never undercounts and an error bound on the overcount; no
+    untracked key can have more than floor arrests. Batches are counted exactly and
+    merged in as summaries of their own.
+    """
+
+    def __init__(self, capacity=SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.counts = pd.Series(dtype='int64')
+        self.errors = pd.Series(dtype='int64')
+        self.floor = 0
+        self.total = 0
+
+    def update(self, values):
+        """
+        This function counts a batch of values, ignoring missing ones
+        :param values: Series
+        """
+        counts = values.value_counts(sort=True)
+        counts = counts[counts > 0]
+        counts.index = counts.index.astype(object)
+        self.total += int(counts.sum())
+        floor = int(counts.iloc[self.capacity]) if len(counts) > self.capacity else 0
+        counts = counts.iloc[:self.capacity]
+        self.merge(counts, pd.Series(0, index=counts.index, dtype='int64'), floor)
+
+    def merge(self, counts, errors, floor):
+        """
+        This function merges another summary in. A key missing from one side may have had
+        up to that side's floor, which goes into both its estimate and its error.
+        :param counts: Series of key -> estimated count
+        :param errors: Series of key -> error bound
+        :param floor: count no key missing from counts can exceed
+        """
+        keys = self.counts.index.union(counts.index)
+        estimates = self.counts.reindex(keys, fill_value=self.floor) + counts.reindex(keys, fill_value=floor)
+        bounds = self.errors.reindex(keys, fill_value=self.floor) + errors.reindex(keys, fill_value=floor)
+        estimates = estimates.sort_values(ascending=False, kind='stable')
+        dropped = estimates.iloc[self.capacity:]
+        self.floor = max(self.floor + floor, int(dropped.iloc[0]) if len(dropped) else 0)
+        self.counts = estimates.iloc[:self.capacity]
+        self.errors = bounds[self.counts.index]
+
+    def top(self, n):
+        """
+        This function lists the n keys with the highest estimates
+        :param n: number of keys
+        :return: DataFrame of estimate and error indexed by key, with guaranteed set where
+            the key is in the true top n whatever the errors
+        """
+        top = pd.DataFrame({'estimate': self.counts.iloc[:n], 'error': self.errors.iloc[:n]})
+        threshold = max(int(self.counts.iloc[n]) if len(self.counts) > n else 0, self.floor)
+        return top.assign(guaranteed=top['estimate'] - top['error'] >= threshold)
+
+
+class Sketches:
+    """
+    Bounded-memory summaries kept while rows stream in: Space-Saving heavy hitters of the
+    crime and home city columns, and a t-digest of ages for every crime type the heavy
+    hitters track. A crime that drops out of the heavy hitters hands its ages to the
+    OTHER_LABEL digest, so memory follows the capacity rather than the rows.
+    """
+
+    def __init__(self, capacity=SKETCH_CAPACITY, compression=SKETCH_COMPRESSION):
+        self.compression = compression
+        self.heavy = {col: SpaceSaving(capacity) for col in SKETCH_COLUMNS}
+        self.ages = {OTHER_LABEL: TDigest(compression)}
+
+    def update(self, rows):
+        """
+        This function adds a chunk of rows to every sketch
+        :param rows: DataFrame after apply_schema
+        """
+        for col, heavy in self.heavy.items():
+            heavy.update(rows[col])
+        tracked = set(self.heavy['crime_code_desc'].counts.index)
+        codes, crimes = pd.factorize(rows['crime_code_desc'])
+        ages = rows['age_at_arrest'].to_numpy(dtype=np.float64, na_value=np.nan)
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(crimes) + 1))
+        for code, crime in enumerate(crimes):
+            if crime not in tracked:
+                crime = OTHER_LABEL
+            elif crime not in self.ages:
+                self.ages[crime] = TDigest(self.compression)
+            self.ages[crime].update(ages[order[bounds[code]:bounds[code + 1]]])
+        for crime in [crime for crime in self.ages if crime != OTHER_LABEL and crime not in tracked]:
+            self.ages[OTHER_LABEL].merge(self.ages.pop(crime))
+
+    def kept(self, col):
+        """
+        This function lists the values of col charted on their own
+        :param col: one of SKETCH_COLUMNS
+        :return: list of the TOP_N heavy hitters
+        """
+        return list(self.heavy[col].top(TOP_N).index)
+
+    def other_ages(self):
+        """
+        This function merges the ages of every crime type charted as OTHER_LABEL: the
+        untracked ones and the tracked ones outside the top TOP_N
+        :return: TDigest
+        """
+        kept = set(self.kept('crime_code_desc'))
+        digest = TDigest(self.compression)
+        for crime, ages in self.ages.items():
+            if crime not in kept:
+                digest.merge(ages)
+        return digest
+
+    def age_summary(self, crime):
+        """
+        This function describes the age distribution of a charted crime type with the
+        bounds of its median
+        :param crime: crime type, or OTHER_LABEL
+        :return: hover text
+        """
+        digest = self.other_ages() if crime == OTHER_LABEL else self.ages.get(crime)
+        if digest is None or not digest.count:
+            return 'no sketched ages'
+        low, median, high = digest.quantile_bounds(0.5)
+        first, third = digest.quantile([0.25, 0.75])
+        return 'median age %.1f (%.1f to %.1f), quartiles %.1f and %.1f, t-digest of %d ages' % (
+            median, low, high, first, third, digest.count)
+
+    def bounds(self, col):
+        """
+        This function describes the count bounds of every charted value of col
+        :param col: one of SKETCH_COLUMNS
+        :return: dict of value -> short text, starred when the value is certainly top
+        """
+        heavy = self.heavy[col]
+        # a tracked value outside the top may have up to its estimate, an untracked one the floor
+        most = max(int(heavy.counts.iloc[TOP_N]) if len(heavy.counts) > TOP_N else 0, heavy.floor)
+        texts = {OTHER_LABEL: 'each at most %d' % most}
+        for value, (estimate, error, guaranteed) in heavy.top(TOP_N).iterrows():
+            texts[value] = '%d to %d%s' % (estimate - error, estimate, '*' if guaranteed else '')
+        return texts
+
+
+def lump_long_tail(data, kept):
+    """
+    This function relabels the values of the sketched columns outside the kept ones as
+    OTHER_LABEL, keeping missing values missing
+    :param data: DataFrame after apply_schema, or cube cells
+    :param kept: dict of column -> values charted on their own
+    :return: DataFrame
+    """
+    columns = {}
+    for col in SKETCH_COLUMNS:
+        if col not in data:
+            continue
+        values = data[col].astype('category')
+        values = values.cat.add_categories([OTHER_LABEL]) if OTHER_LABEL not in values.cat.categories else values
+        columns[col] = values.where(values.isin(kept[col]) | values.isna(), OTHER_LABEL)
+        columns[col] = columns[col].cat.remove_unused_categories()
+    return data.assign(**columns)
+
+
+class SketchStream:
+    """
+    What sketch mode keeps while the rows stream through it: the Sketches, cube tables
+    whose crime and home city values are lumped as OTHER_LABEL whenever the heavy hitters
+    stop tracking them, daily totals for the date index and a running version hash.
+    Memory follows the sketch capacity and the number of days, each chunk of rows is
+    dropped once it is counted. A value is only counted on its own from the time the
+    heavy hitters track it, like its age digest.
+    """
+
+    def __init__(self):
+        self.sketches = Sketches()
+        self.tables = {}
+        self.daily = None
+        self.digest = hashlib.sha1()
+
+    def update(self, rows):
+        """
+        This function counts a chunk of rows into the sketches, tables and daily totals
+        :param rows: DataFrame after apply_schema
+        """
+        self.sketches.update(rows)
+        tracked = {col: set(heavy.counts.index) for col, heavy in self.sketches.heavy.items()}
+        for dims, table in CountCube.from_data(lump_long_tail(rows, tracked)).tables.items():
+            if dims in self.tables:
+                table = lump_long_tail(concat_categorical([self.tables[dims], table]), tracked)
+                table = table.groupby(list(dims), observed=True, dropna=False)[MEASURES].sum().reset_index()
+            self.tables[dims] = table
+        daily = daily_totals(rows)
+        self.daily = daily if self.daily is None else pd.concat([self.daily, daily]).groupby(level=0).sum()
+        self.digest.update(row_fingerprints(rows).to_numpy().tobytes())
+
+    def dataset(self):
+        """
+        This function lumps everything outside the charted heavy hitters and wraps the
+        result as a Dataset without rows
+        :return: Dataset
+        """
+        kept = {col: set(self.sketches.kept(col)) for col in SKETCH_COLUMNS}
+        tables = {dims: lump_long_tail(table, kept).groupby(list(dims), observed=True, dropna=False)[MEASURES]
+                  .sum().reset_index() for dims, table in self.tables.items()}
+        return Dataset(None, CountCube(tables, self.sketches), None, DateIndex.from_daily(self.daily),
+                       self.digest.hexdigest()[:16])
+
+
+class RowIndex:
+    """
+    Inverted index from every value of the filter columns to the sorted ids of the rows
+    holding it, next to each row's value code. A selection materializes only the
+    cheapest column's ids (a union of its value lists) and checks the remaining columns
+    on those candidates through the codes, so its cost follows the selection rather
+    than the table size.
+    """
+
+    def __init__(self, codes, uniques, orders, bounds):
+        self.codes = codes
+        self.uniques = uniques
+        self.orders = orders
+        self.bounds = bounds
+        self.postings = {col: [orders[col][start:end] for start, end in zip(bounds[col][:-1], bounds[col][1:])]
+                         for col in codes}
+
+    @classmethod
+    def from_data(cls, data, columns=FILTER_COLUMNS):
+        """
+        This function indexes the filter columns of a frame
+        :param data: DataFrame after apply_schema
+        :param columns: columns to index
+        :return: RowIndex
+        """
+        codes, uniques, orders, bounds = {}, {}, {}, {}
+        for col in columns:
+            col_codes, uniques[col] = pd.factorize(data[col], sort=True)
+            # stable sort keeps the row ids of each value ascending, missing values go first
+            orders[col] = np.argsort(col_codes, kind='stable').astype(np.int32)
+            counts = np.bincount(col_codes[col_codes >= 0], minlength=len(uniques[col]))
+            bounds[col] = np.concatenate([[0], np.cumsum(counts)]) + np.count_nonzero(col_codes < 0)
+            codes[col] = col_codes.astype(np.int16 if len(uniques[col]) < 2 ** 15 else np.int32)
+        return cls(codes, uniques, orders, bounds)
+
+    def values(self, col):
+        return list(self.uniques[col])
+
+    def accepted(self, col, values):
+        """
+        This function marks the value codes a filter accepts
+        :param col: filter column
+        :param values: accepted values, or an inclusive (low, high) pair for range columns
+        :return: boolean numpy array indexed by value code, with a trailing False for the
+            -1 code of missing values
+        """
+        uniques = self.uniques[col]
+        if col in RANGE_COLUMNS:
+            low, high = values
+            accepted = (uniques >= low) & (uniques <= high)
+        else:
+            accepted = pd.Index(uniques).isin(values)
+        return np.append(np.asarray(accepted), False)
+
+    def select(self, params):
+        """
+        This function evaluates filter params, AND across columns and OR within one
+        :param params: tuple of (column, values) pairs
+        :return: sorted numpy array of row ids, or None when nothing is filtered
+        """
+        if not params:
+            return None
+        filters = []
+        for col, values in params:
+            accepted = self.accepted(col, values)
+            size = sum(len(self.postings[col][code]) for code in np.flatnonzero(accepted[:-1]))
+            filters.append((size, col, accepted))
+        filters.sort(key=lambda item: item[0])
+        _, col, accepted = filters[0]
+        lists = [self.postings[col][code] for code in np.flatnonzero(accepted[:-1])]
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+        # the lists of different values are disjoint, so a sort is a union
+        ids = lists[0] if len(lists) == 1 else np.sort(np.concatenate(lists))
+        for _, col, accepted in filters[1:]:
+            ids = ids[accepted[self.codes[col][ids]]]
+        return ids
+
+
+def daily_totals(data):
+    """
+    This function counts the arrests and adds up the known ages of every arrest date
+    :param data: DataFrame after apply_schema
+    :return: DataFrame of count, age_sum and age_count indexed by date, undated rows left out
+    """
+    ages = data['age_at_arrest'].astype('float64')
+    return ages.groupby(data['date_of_arrest']).agg(['size', 'sum', 'count']).set_axis(MEASURES, axis=1)
+
+
+class DateIndex:
+    """
+    The arrest dates in order with prefix sums of the arrests, ages and known ages up to
+    each one. Any date range count or mean age is two binary searches and a difference,
+    and resampling or a rolling average is the same thing done for every bin at once.
+    """
+
+    def __init__(self, dates, counts, age_sum, age_count):
+        self.dates = dates
+        self.counts = counts
+        self.age_sum = age_sum
+        self.age_count = age_count
+
+    @classmethod
+    def from_data(cls, data):
+        """
+        This function totals the dated rows per day and accumulates the totals
+        :param data: DataFrame after apply_schema
+        :return: DateIndex
+        """
+        return cls.from_daily(daily_totals(data))
+
+    @classmethod
+    def from_daily(cls, daily):
+        """
+        This function accumulates daily totals, a date may appear more than once and
+        retractions may be negative; dates left without arrests are dropped
+        :param daily: DataFrame from daily_totals, or several of them concatenated
+        :return: DateIndex
+        """
+        daily = daily.groupby(level=0).sum()
+        daily = daily[daily['count'] != 0]
+        return cls(daily.index.to_numpy(),
+                   *[np.concatenate([[0], np.cumsum(daily[measure].to_numpy())]) for measure in MEASURES])
+
+    def daily(self):
+        """
+        This function recovers the daily totals the prefix sums were accumulated from
+        :return: DataFrame like daily_totals
+        """
+        return pd.DataFrame({measure: np.diff(sums) for measure, sums in zip(MEASURES, [self.counts, self.age_sum,
+                                                                                        self.age_count])},
+                            index=pd.Index(self.dates))
+
+    def first(self):
+        return pd.Timestamp(self.dates[0]) if len(self.dates) else None
+
+    def last(self):
+        return pd.Timestamp(self.dates[-1]) if len(self.dates) else None
+
+    def positions(self, edges):
+        """
+        This function finds where timestamps would go in the sorted dates
+        :param edges: timestamps
+        :return: numpy array of positions, counting the distinct dates strictly before each edge
+        """
+        return np.searchsorted(self.dates, pd.DatetimeIndex(edges).to_numpy().astype(self.dates.dtype), side='left')
+
+    def count(self, start, end):
+        """
+        This function counts the arrests with start <= date < end
+        """
+        low, high = self.positions([start, end])
+        return int(self.counts[high] - self.counts[low])
+
+    def resample(self, start, end, freq='M', window=1):
+        """
+        This function counts arrests and averages ages per calendar period between start
+        and end (inclusive), with a rolling mean of the counts over window periods
+        :param start: first day shown
+        :param end: last day shown
+        :param freq: pandas period alias, 'D', 'W' or 'M'
+        :param window: periods in the rolling mean
+        :return: DataFrame with period, arrests, rolling_arrests and mean_age
+        """
+        start = pd.Timestamp(start).normalize()
+        stop = pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+        periods = pd.period_range(start, end, freq=freq)
+        lefts = periods.start_time.where(periods.start_time > start, start)
+        rights = (periods + 1).start_time.where((periods + 1).start_time < stop, stop)
+        low = self.positions(lefts)
+        high = self.positions(rights)
+        arrests = self.counts[high] - self.counts[low]
+        # a rolling sum is a difference of the same prefix sums
+        window_low = low[np.maximum(np.arange(len(low)) - window + 1, 0)]
+        width = np.minimum(np.arange(len(low)) + 1, window)
+        ages = self.age_count[high] - self.age_count[low]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_age = (self.age_sum[high] - self.age_sum[low]) / ages
+        return pd.DataFrame({
+            'period': lefts,
+            'arrests': arrests,
+            'rolling_arrests': (self.counts[high] - self.counts[window_low]) / width,
+            'mean_age': mean_age,
+        })
+
+
+def date_trend(dates, start, end, freq='M', window=1):
+    """
+    This function plots arrests per period between two dates with their rolling mean
+    :param dates: DateIndex
+    :param start: first day shown
+    :param end: last day shown
+    :param freq: 'D', 'W' or 'M'
+    :param window: periods in the rolling mean
+    :return:
+    """
+    trend = dates.resample(start, end, freq, window)
+    fig = px.line(trend, x='period', y=['arrests', 'rolling_arrests'],
+                  hover_data={'mean_age': ':.1f'},
+                  title='Arrests over time',
+                  labels={'period': 'Date of Arrest', 'value': 'Number of Arrests', 'variable': '',
+                          'mean_age': 'Mean Age at Arrest'})
+    return fig
+
+
+def city_histogram(cube, counts, color, title, labels, frame=None):
+    """
+    This function draws pre-binned (year, home city, color) counts as stacked log-y bars,
+    one animation frame per year. Only the counts are serialized into the figure.
+    :param cube: CountCube the counts were rolled up from
+    :param counts: DataFrame with year_of_arrest, arrestee_home_city, color and count
+    :param color: column used for the bar colors
+    :param title: figure title
+    :param labels: axis labels
+    :param frame: year to show on its own instead of animating every year
+    :return: figure
+    """
+    counts, frame_args = frame_slice(counts, 'year_of_arrest', frame, 'arrestee_home_city', 'count', color=color,
+                                     stacked=True, log_y=True)
+    fig = px.bar(counts, x='arrestee_home_city', y='count',
+                 color=color,
+                 log_y=True,
+                 title=title,
+                 labels=labels,
+                 **frame_args)
+    return sketch_bounds(fig, cube, 'arrestee_home_city', frame_args['category_orders']['arrestee_home_city'])
+
+
+def city_sex(cube, frame=None):
+  counts = cube.rollup(['year_of_arrest', 'arrestee_home_city', 'arrestee_sex'])
+  counts = counts[counts['arrestee_sex'].isin(['MALE', 'FEMALE'])]
+  return city_histogram(cube, counts, 'arrestee_sex',
+                        title = 'Relationship Between Offender Home City and Sex',
+                        labels = {'arrestee_home_city' : 'Offender Home City'}, frame=frame)
+
+
+def city_age(cube, frame=None):
   bins= [0,13,20,50,110]
   labels = ['Kid','Teen','Adult','Elder']
-  data_age['AgeGroup'] = pd.cut(data_age['age_at_arrest'], bins=bins, labels=labels, right=False)
-  fig = px.histogram(data_age, x = data_age['arrestee_home_city'],
-                     y = data_age['arrestee_home_city'].index,
-                     color = data_age['AgeGroup'],
-                     animation_frame=data_age['year_of_arrest'],
-                     log_y = True,
-                     title = 'Relationship Between Offender Home City and Age',
-                     labels = {'arrestee_home_city' : 'Offender Home City'})
-  return fig
+  counts = cube.binned_ages(['year_of_arrest', 'arrestee_home_city'], 'AgeGroup', bins, labels, right=False)
+  return city_histogram(cube, counts, 'AgeGroup',
+                        title = 'Relationship Between Offender Home City and Age',
+                        labels = {'arrestee_home_city' : 'Offender Home City'}, frame=frame)
 
 
-def city_crime_type(data):
-  fig = px.histogram(data, x = data['arrestee_home_city'],
-                     y = data['arrestee_home_city'].index,
-                     color = data['crime_code_desc'],
-                     animation_frame=data['year_of_arrest'],
-                     log_y = True,
-                     title = 'Relationship Between Offender Home City and Crime Types',
-                     labels = {'arrestee_home_city' : 'Offender Home City',
-                               'arrestee_race' : 'Offender Race'})
-  return fig
+def city_crime_type(cube, frame=None):
+  counts = cube.rollup(['year_of_arrest', 'arrestee_home_city', 'crime_code_desc'])
+  return city_histogram(cube, counts, 'crime_code_desc',
+                        title = 'Relationship Between Offender Home City and Crime Types',
+                        labels = {'arrestee_home_city' : 'Offender Home City',
+                                  'arrestee_race' : 'Offender Race'}, frame=frame)
 
 
-def city_race(data):
-    fig = px.histogram(data, x = data['arrestee_home_city'],
-                     y = data['arrestee_home_city'].index,
-                     color = data['arrestee_race'],
-                     animation_frame=data['year_of_arrest'],
-                     log_y = True,
-                     title = 'Relationship Between Offender Home City and Race',
-                     labels = {'arrestee_home_city' : 'Offender Home City',})
-    return fig
+def city_race(cube, frame=None):
+    counts = cube.rollup(['year_of_arrest', 'arrestee_home_city', 'arrestee_race'])
+    return city_histogram(cube, counts, 'arrestee_race',
+                          title = 'Relationship Between Offender Home City and Race',
+                          labels = {'arrestee_home_city' : 'Offender Home City',}, frame=frame)
 
 
 def preprocess(dataframe):
-    df1 = dataframe.copy()
-    df1['age_at_arrest'] = df1['age_at_arrest'].astype(float)
-
-    # convert year to datetime and drop month
-    df1['year_of_arrest'] = pd.to_datetime(df1['year_of_arrest'], format='%Y')
-    df1.drop(columns='month_of_arrest', inplace=True)
+    # drop month, the age figures only look at ages
+    df1 = dataframe.drop(columns='month_of_arrest')
 
     # Creating Age Category Column
-    bins = [0, 18, 24, 34, 54, 74, 84, 100]
-    labels = ['0 to 18', '18 to 24', '24 to 34', '34 to 54', '54 to 74', '74 to 84', "84 to 100"]
-    df1['Arreste Age Category'] = pd.cut(df1['age_at_arrest'], bins=bins, labels=labels, right=False)
+    df1['Arreste Age Category'] = pd.cut(df1['age_at_arrest'], bins=AGE_CATEGORY_BINS, labels=AGE_CATEGORY_LABELS,
+                                         right=False)
 
     return df1
 
 
-def age_crimetype(dataframe):
+def age_crimetype(cube):
     import plotly.graph_objects as go
 
-    age_crimetype_df = dataframe[["age_at_arrest", "crime_code_desc", "arrestee_sex"]]
-    age_crimetype_df = pd.DataFrame(age_crimetype_df.groupby("crime_code_desc")["age_at_arrest"].mean())
-    age_crimetype_df.reset_index(inplace=True)
+    age_crimetype_df = cube.rollup(["crime_code_desc"])
+    # a filtered crime type may have no known ages, and so no mean age
+    age_crimetype_df = age_crimetype_df[age_crimetype_df["age_count"] > 0]
+    age_crimetype_df = age_crimetype_df.assign(age_at_arrest=age_crimetype_df["age_sum"] / age_crimetype_df["age_count"])
     age_crimetype_df = age_crimetype_df[age_crimetype_df["crime_code_desc"] != "."]
-    age_crimetype_df
     age_crimetype_df.sort_values(by="age_at_arrest", ascending=True, inplace=True)
     age_crimetype_df["age_at_arrest"] = age_crimetype_df["age_at_arrest"].astype("int")
 
+    # sketch mode adds the t-digest median and quartiles of every crime type to the hover
+    hovertext = None
+    if cube.sketches is not None:
+        hovertext = [cube.sketches.age_summary(crime) for crime in age_crimetype_df["crime_code_desc"]]
+
     fig = go.Figure()
     fig.add_trace(go.Bar(
         y=age_crimetype_df["crime_code_desc"],
         x=age_crimetype_df["age_at_arrest"],
+        hovertext=hovertext,
         name='Age at Arrest',
         orientation='h',
         marker=dict(
@@ -327,21 +1759,19 @@ def age_crimetype(dataframe):
     return fig
 
 
-def age_crimecount(dataframe):
-    age_minor_df = pd.DataFrame(dataframe.groupby("Arreste Age Category")["Arreste Age Category"].count())
-    age_minor_df.rename(columns={"Arreste Age Category": "Count"}, inplace=True)
-    age_minor_df.reset_index(inplace=True)
+def age_crimecount(cube):
+    age_minor_df = cube.binned_ages([], "Arreste Age Category", AGE_CATEGORY_BINS, AGE_CATEGORY_LABELS, right=False)
+    age_minor_df = age_minor_df.rename(columns={"count": "Count"})
 
     fig = px.bar(age_minor_df, x="Arreste Age Category", y="Count",
                  title="Number of Arrest made for different age category")
     return fig
 
 
-def age_resolution(dataframe):
-    age_resolution_df = pd.DataFrame(
-        dataframe.groupby(["arrest_res", "Arreste Age Category"])["Arreste Age Category"].count())
-    age_resolution_df.rename(columns={"Arreste Age Category": "Count"}, inplace=True)
-    age_resolution_df.reset_index(inplace=True)
+def age_resolution(cube):
+    age_resolution_df = cube.binned_ages(["arrest_res"], "Arreste Age Category", AGE_CATEGORY_BINS,
+                                         AGE_CATEGORY_LABELS, right=False)
+    age_resolution_df = age_resolution_df.rename(columns={"count": "Count"})
 
     fig = px.bar(age_resolution_df, x='arrest_res', y='Count',
                  color='Arreste Age Category',
@@ -351,120 +1781,1442 @@ def age_resolution(dataframe):
     return fig
 
 
-def dash_layout():
-    data = get_data()
-    app.layout = html.Div(children=
-    [
-        html.Div
-            ([
-            html.H1(id='H1', children='Number of Arrests made each year', style={'textAlign': 'center',
-                                                                                 'marginTop': 40,
-                                                                                 'marginBottom': 40}),
-            dcc.Graph(id='yearwise_arrests_plot', figure=yearwise_arrests(data))
-        ]),
-        ([
-            html.H1(id='H1', children='Number of Offenders for each arrest resolution', style={'textAlign': 'center',
-                                                                                 'marginTop': 40,
-                                                                                 'marginBottom': 40}),
-            dcc.Graph(id='arrest_res_plot', figure=case_res(data))
-        ]),
-        ([
-            html.H1(id='H1', children='Number of Arrests made each year', style={'textAlign': 'center',
-                                                                                 'marginTop': 40,
-                                                                                 'marginBottom': 40}),
-            dcc.Graph(id='line_plot', figure=arrest_types(data))
-        ]),
-        ([
-            html.H1(id='H1', children='Number of Arrests made each year', style={'textAlign': 'center',
-                                                                                 'marginTop': 40,
-                                                                                 'marginBottom': 40}),
-            dcc.Graph(id='line_plot', figure=arrest_types(data))
-        ]),
-        ([
-            html.H1(id='H1', children='Trend of number of offenders per year based on Arrest type',
-                    style={'textAlign': 'center', 'marginTop': 40, 'marginBottom': 40}),
-            dcc.Graph(id='line_plot', figure=monthly_arrests(data))
-        ]),
-        ([
-            html.H1(id='H1', children='Number of Arrests by race', style={'textAlign': 'center',
-                                                                                 'marginTop': 40,
-                                                                                 'marginBottom': 40}),
-            dcc.Graph(id='line_plot', figure=arrests_by_race(data))
-        ]),
-        ([
-            html.H1(id='H1', children='Number of Arrests by sex', style={'textAlign': 'center',
-                                                                                 'marginTop': 40,
-                                                                                 'marginBottom': 40}),
-            dcc.Graph(id='line_plot', figure=arrests_by_sex(data))
-        ]),
-        ([
-            html.H1(id='H1', children='Number of Juvenile/Non-Juvenile Arrests', style={'textAlign': 'center',
-                                                                                 'marginTop': 40,
-                                                                                 'marginBottom': 40}),
-            dcc.Graph(id='line_plot', figure=cat1_arrests(data))
-        ]),
-        ([
-            html.H1(id='H1', children='Number of Arrests in each Age Group', style={'textAlign': 'center',
-                                                                                 'marginTop': 40,
-                                                                                 'marginBottom': 40}),
-            dcc.Graph(id='line_plot', figure=cat2_arrests(data))
-        ]),
-        ([
-            html.H1(id='H1', children='Crimes Commited by Different Age Groups', style={'textAlign': 'center',
-                                                                                        'marginTop': 40,
-                                                                                        'marginBottom': 40}),
-            dcc.Graph(id='bar_chart', figure=plot_fig1(data), style={'width': 1500, 'height': 1000})
-        ]),
-        ([
-            html.H1(id='H2', children='Punishment for Crime Commited', style={'textAlign': 'center',
-                                                                              'marginTop': 40, 'marginBottom': 40}),
-            dcc.Graph(id='bar_chart', figure=plot_fig2(data), style={'width': 1500, 'height': 1000})
-        ]),
-        ([
-            html.H1(id='H3', children='Method of Arresting the Suspect', style={'textAlign': 'center',
-                                                                                'marginTop': 40, 'marginBottom': 40}),
-            dcc.Graph(id='bar_chart', figure=plot_fig3(data), style={'width': 1500, 'height': 1000})
-        ]),
-        ([
-            html.H1(id='H3', children='Relationship Between Offender Home City and Sex', style={'textAlign': 'center',
-                                                                                'marginTop': 40, 'marginBottom': 40}),
-            dcc.Graph(id='bar_chart', figure=city_sex(data), style={'width': 1500, 'height': 1000})
-        ]),
-        ([
-            html.H1(id='H3', children='Relationship Between Offender Home City and Race',
-                    style={'textAlign': 'center', 'marginTop': 40, 'marginBottom': 40}),
-            dcc.Graph(id='bar_chart', figure=city_race(data), style={'width': 1500, 'height': 1000})
-        ]),
-        ([
-            html.H1(id='H3', children='Relationship Between Offender Home City and Age', style={'textAlign': 'center',
-                                                                                'marginTop': 40, 'marginBottom': 40}),
-            dcc.Graph(id='bar_chart', figure=city_age(data), style={'width': 1500, 'height': 1000})
-        ]),
-        ([
-            html.H1(id='H3', children='Relationship Between Offender Home City and Crime Types',
-                    style={'textAlign': 'center', 'marginTop': 40, 'marginBottom': 40}),
-            dcc.Graph(id='bar_chart', figure=city_crime_type(data), style={'width': 1500, 'height': 1000})
-        ]),
-        ([
-            html.H1(id='H3', children='Crime Type VS Mean Age at Arrest',
-                    style={'textAlign': 'center', 'marginTop': 40, 'marginBottom': 40}),
-            dcc.Graph(id='bar_chart', figure=age_crimetype(age_df), style={'width': 1500, 'height': 1000})
-        ]),
-        ([
-            html.H1(id='H3', children='Number of Arrest made for different age category',
-                    style={'textAlign': 'center', 'marginTop': 40, 'marginBottom': 40}),
-            dcc.Graph(id='bar_chart', figure=age_crimecount(age_df), style={'width': 1500, 'height': 1000})
+# figure name -> (heading, builder, graph style, animated column), in dashboard order
+FIGURES = OrderedDict([
+    ('yearwise_arrests', ('Number of Arrests made each year', yearwise_arrests, {}, None)),
+    ('case_res', ('Number of Offenders for each arrest resolution', case_res, {}, None)),
+    ('arrest_types', ('Number of Arrests made each year', arrest_types, {}, 'year_of_arrest')),
+    ('monthly_arrests', ('Trend of number of offenders per year based on Arrest type', monthly_arrests, {}, None)),
+    ('arrests_by_race', ('Number of Arrests by race', arrests_by_race, {}, 'month_of_arrest')),
+    ('arrests_by_sex', ('Number of Arrests by sex', arrests_by_sex, {}, 'month_of_arrest')),
+    ('cat1_arrests', ('Number of Juvenile/Non-Juvenile Arrests', cat1_arrests, {}, 'month_of_arrest')),
+    ('cat2_arrests', ('Number of Arrests in each Age Group', cat2_arrests, {}, 'month_of_arrest')),
+    ('plot_fig1', ('Crimes Commited by Different Age Groups', plot_fig1, LARGE_GRAPH_STYLE, None)),
+    ('plot_fig2', ('Punishment for Crime Commited', plot_fig2, LARGE_GRAPH_STYLE, None)),
+    ('plot_fig3', ('Method of Arresting the Suspect', plot_fig3, LARGE_GRAPH_STYLE, None)),
+    ('city_sex', ('Relationship Between Offender Home City and Sex', city_sex, LARGE_GRAPH_STYLE, 'year_of_arrest')),
+    ('city_race', ('Relationship Between Offender Home City and Race', city_race, LARGE_GRAPH_STYLE, 'year_of_arrest')),
+    ('city_age', ('Relationship Between Offender Home City and Age', city_age, LARGE_GRAPH_STYLE, 'year_of_arrest')),
+    ('city_crime_type', ('Relationship Between Offender Home City and Crime Types',
+                         city_crime_type, LARGE_GRAPH_STYLE, 'year_of_arrest')),
+    ('age_crimetype', ('Crime Type VS Mean Age at Arrest', age_crimetype, LARGE_GRAPH_STYLE, None)),
+    ('age_crimecount', ('Number of Arrest made for different age category', age_crimecount, LARGE_GRAPH_STYLE, None)),
+    ('age_resolution', ('Count of People arrested vs Arrest Resolution', age_resolution, LARGE_GRAPH_STYLE, None)),
+])
+
+
+def row_fingerprints(rows):
+    """
+    This function hashes every row by its values, whichever dtypes apply_schema picked
+    for the frame it came from
+    :param rows: DataFrame with the dashboard columns
+    :return: Series of hashes indexed by arrest_code
+    """
+    hashes = pd.util.hash_pandas_object(rows[list(COLUMNS.values())].astype(str), index=False)
+    return pd.Series(hashes.to_numpy(), index=rows['arrest_code'].to_numpy())
+
+
+class Dataset:
+    """
+    The arrests rows together with their count cube, row and date indexes and a version
+    string that changes whenever the rows change. The rows are either a DataFrame or a
+    memory-mapped Arrow table attached from a SharedStore. Indexes left out are built
+    from the rows on first use. A sketched dataset has no rows, only its cube and date
+    index, and cannot be filtered.
+    """
+
+    def __init__(self, data, cube, index, dates, version):
+        self.data = data
+        self.cube = cube
+        self._index = index
+        self._dates = dates
+        self.version = version
+        self._filtered = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def index(self):
+        with self._lock:
+            if self._index is None:
+                self._index = RowIndex.from_data(self.data)
+            return self._index
+
+    @property
+    def filterable(self):
+        return self.data is not None
+
+    @property
+    def dates(self):
+        with self._lock:
+            if self._dates is None:
+                self._dates = DateIndex.from_data(self.data)
+            return self._dates
+
+    @classmethod
+    @instrumented('index')
+    def from_data(cls, data):
+        """
+        This function builds the cube and indexes of a freshly loaded frame
+        :param data: DataFrame after apply_schema
+        :return: Dataset
+        """
+        row_hashes = pd.util.hash_pandas_object(data, index=False).to_numpy()
+        version = hashlib.sha1(row_hashes.tobytes()).hexdigest()[:16]
+        return cls(data, CountCube.from_data(data), RowIndex.from_data(data), DateIndex.from_data(data), version)
+
+    def values(self, col):
+        """
+        This function lists the distinct values of a filter column, reading the cube when
+        it holds the column so that an updated dataset does not need its row index
+        :param col: filter column
+        :return: sorted list
+        """
+        if col in CUBE_DIMENSIONS:
+            return [value.item() if hasattr(value, 'item') else value for value in self.cube.rollup([col])[col]]
+        if not self.filterable:
+            return []
+        return [str(value) for value in self.index.values(col)]
+
+    def apply_delta(self, rows, deleted=()):
+        """
+        This function applies a batch of new or revised arrests, keyed by arrest_code, and
+        removes the deleted ones. Rows identical to the stored copy are skipped, the old
+        copies of the others are retracted from the count cube before the new ones are
+        counted in, and the version moves on from a hash of the delta alone. The rows are
+        copied once and the daily totals of the delta merged into the date index; the row
+        index is rebuilt on first use.
+        :param rows: DataFrame of new or revised rows after apply_schema
+        :param deleted: arrest codes to remove
+        :return: Dataset, or self when nothing changed
+        """
+        if not self.filterable:
+            raise ValueError('a sketched dataset keeps no rows to apply a delta to, load it again instead')
+        data = self.data if isinstance(self.data, pd.DataFrame) else self.data.to_pandas()
+        rows = rows.drop_duplicates('arrest_code', keep='last', ignore_index=True)
+        deleted = [str(code) for code in deleted]
+        # the only pass over every row, the rest works on the rows it hits
+        hits = np.flatnonzero(data['arrest_code'].isin(list(rows['arrest_code']) + deleted).to_numpy())
+        stored = data.iloc[hits]
+        known = row_fingerprints(stored)
+        fresh = row_fingerprints(rows)
+        rows = rows[(fresh != known.reindex(fresh.index)).to_numpy()]
+        hits = hits[stored['arrest_code'].isin(list(rows['arrest_code']) + deleted).to_numpy()]
+        if rows.empty and not len(hits):
+            return self
+        retracted = np.zeros(len(data), dtype=bool)
+        retracted[hits] = True
+        removed = data.iloc[hits]
+        cube = self.cube.apply_delta(rows, removed)
+        dates = DateIndex.from_daily(pd.concat([self.dates.daily(), daily_totals(rows), -daily_totals(removed)]))
+        data = concat_categorical([data[~retracted], rows])
+        digest = hashlib.sha1(self.version.encode())
+        digest.update(pd.util.hash_pandas_object(rows, index=False).to_numpy().tobytes())
+        digest.update(pd.util.hash_pandas_object(removed['arrest_code'], index=False).to_numpy().tobytes())
+        return Dataset(data, cube, None, dates, digest.hexdigest()[:16])
+
+    def rows(self, ids):
+        """
+        This function materializes the selected rows as a DataFrame
+        :param ids: sorted numpy array of row ids
+        :return: DataFrame
+        """
+        if isinstance(self.data, pd.DataFrame):
+            return self.data.take(ids)
+        return self.data.take(ids).to_pandas()
+
+    def _for(self, kind, params, build):
+        """
+        This function builds a structure over the rows selected by filter params, reading
+        only the selected rows and remembering the last few selections
+        """
+        key = (kind, params)
+        with self._lock:
+            if key in self._filtered:
+                self._filtered.move_to_end(key)
+                return self._filtered[key]
+        value = build(self.rows(self.index.select(params)))
+        with self._lock:
+            self._filtered[key] = value
+            if len(self._filtered) > FILTERED_CUBES:
+                self._filtered.popitem(last=False)
+        return value
+
+    def cube_for(self, params):
+        """
+        This function returns the count cube of the rows selected by filter params
+        :param params: tuple of (column, values) pairs, empty for the whole dataset
+        :return: CountCube
+        """
+        if not params:
+            return self.cube
+        return self._for('cube', params, CountCube.from_data)
+
+    def dates_for(self, params):
+        """
+        This function returns the date index of the rows selected by filter params
+        :param params: tuple of (column, values) pairs, empty for the whole dataset
+        :return: DateIndex
+        """
+        if not params:
+            return self.dates
+        return self._for('dates', params, DateIndex.from_data)
+
+
+@instrumented('sketch')
+def load_sketched(url=API_URL, offline=OFFLINE, ttl=CACHE_TTL, cache_dir=CACHE_DIR):
+    """
+    This function is get_data for sketch mode: the snapshot, or the API when it is stale,
+    is streamed through a SketchStream a chunk at a time and no rows are kept. A fetch
+    writes the pages to a new snapshot as they arrive.
+    :param url: resource endpoint
+    :param offline: never touch the network, fail if there is no snapshot
+    :param ttl: seconds a snapshot stays fresh
+    :param cache_dir: snapshot directory
+    :return: Dataset without rows
+    """
+    def from_snapshot():
+        stream = SketchStream()
+        for chunk in iter_snapshot(cache_dir):
+            stream.update(apply_schema(chunk))
+        return stream.dataset()
+
+    meta = read_meta(cache_dir)
+    if meta is not None and (offline or time.time() - meta['fetched_at'] < ttl):
+        return from_snapshot()
+    if offline:
+        raise RuntimeError('No arrests snapshot in %s and offline mode is on' % cache_dir)
+    stream = SketchStream()
+    try:
+        if feather is None:
+            fetch_records(url, consume=lambda page: stream.update(apply_schema(page)))
+        else:
+            with snapshot_writer(cache_dir) as write:
+                def consume(page):
+                    write(page)
+                    stream.update(apply_schema(page))
+
+                fetch_records(url, consume=consume)
+    except requests.RequestException:
+        if meta is None:
+            raise
+        # keep serving the stale snapshot until the API is reachable again
+        return from_snapshot()
+    return stream.dataset()
+
+
+def load_dataset(url=API_URL, ttl=CACHE_TTL, cache_dir=CACHE_DIR):
+    """
+    This function loads the dataset with its cube and indexes, or only its sketches in
+    sketch mode
+    :param url: resource endpoint
+    :param ttl: seconds a snapshot stays fresh
+    :param cache_dir: snapshot directory
+    :return: Dataset
+    """
+    if SKETCH_MODE:
+        return load_sketched(url, ttl=ttl, cache_dir=cache_dir)
+    return Dataset.from_data(get_data(url, ttl=ttl, cache_dir=cache_dir))
+
+
+def refresh_dataset(dataset, url=API_URL, cache_dir=CACHE_DIR):
+    """
+    This function applies the rows at or after the snapshot's high-water mark to a
+    dataset as a delta and stores the result as the new snapshot. Without a snapshot to
+    start from, or rows to apply a delta to in sketch mode, the dataset is loaded again
+    in full.
+    :param dataset: Dataset the snapshot was written from
+    :param url: resource endpoint
+    :param cache_dir: snapshot directory
+    :return: Dataset, the same one when nothing changed upstream
+    """
+    meta = read_meta(cache_dir)
+    if meta is None or meta['high_water_mark'] is None or not dataset.filterable:
+        return load_dataset(url, ttl=0, cache_dir=cache_dir)
+    newer = apply_schema(pd.concat(fetch_records(url, "date_of_arrest >= '%s'" % meta['high_water_mark']),
+                                   ignore_index=True))
+    updated = dataset.apply_delta(newer)
+    if updated is dataset:
+        write_meta(dict(meta, fetched_at=time.time()), cache_dir)
+    else:
+        append_snapshot(newer, (), updated.data, cache_dir)
+    return updated
+
+
+class SharedStore:
+    """
+    A directory per dataset version holding the rows, the count cube and the index arrays
+    as memory-mappable files, plus a CURRENT file naming the published version. Serving
+    processes attach to it read-only, so the page cache holds one copy for all of them.
+    Loading and publishing happen under an exclusive file lock: only one process fetches
+    from the API per refresh, the others wait and attach to what it published.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR):
+        self.root = os.path.join(cache_dir, 'store')
+        self.cache_dir = cache_dir
+
+    def current(self):
+        path = os.path.join(self.root, 'CURRENT')
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return f.read().strip()
+
+    @contextlib.contextmanager
+    def lock(self, name='refresh.lock'):
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, name), 'w') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def publish(self, dataset):
+        """
+        This function writes a dataset version and makes it current. The version it
+        replaces stays on disk until the next publish, so a process that read CURRENT just
+        before can still attach to it; older ones are removed, processes still mapping
+        them keep reading until they re-attach.
+        :param dataset: Dataset built from a DataFrame, or a sketched one without rows
+        """
+        previous = self.current()
+        directory = os.path.join(self.root, dataset.version)
+        os.makedirs(directory, exist_ok=True)
+        dataset.cube.write(os.path.join(directory, 'cube'))
+        if dataset.cube.sketches is not None:
+            with open(os.path.join(directory, 'sketches.pickle'), 'wb') as f:
+                pickle.dump(dataset.cube.sketches, f)
+        if dataset.filterable:
+            feather.write_feather(dataset.data.reset_index(drop=True), os.path.join(directory, 'rows.arrow'),
+                                  compression='uncompressed')
+            index = dataset.index
+            for col in index.codes:
+                np.save(os.path.join(directory, 'codes-%s.npy' % col), index.codes[col])
+                np.save(os.path.join(directory, 'order-%s.npy' % col), index.orders[col])
+                np.save(os.path.join(directory, 'bounds-%s.npy' % col), index.bounds[col])
+            with open(os.path.join(directory, 'uniques.json'), 'w') as f:
+                json.dump({col: [value.item() if hasattr(value, 'item') else value for value in uniques]
+                           for col, uniques in index.uniques.items()}, f)
+        for name in ['dates', 'counts', 'age_sum', 'age_count']:
+            np.save(os.path.join(directory, name + '.npy'), getattr(dataset.dates, name))
+        with open(os.path.join(self.root, 'CURRENT.tmp'), 'w') as f:
+            f.write(dataset.version)
+        os.replace(os.path.join(self.root, 'CURRENT.tmp'), os.path.join(self.root, 'CURRENT'))
+        for stale in os.listdir(self.root):
+            path = os.path.join(self.root, stale)
+            if os.path.isdir(path) and stale not in (dataset.version, previous):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def attach(self, version=None):
+        """
+        This function maps a published version read-only
+        :param version: defaults to the current version
+        :return: Dataset
+        """
+        version = version or self.current()
+        directory = os.path.join(self.root, version)
+
+        def mapped(name):
+            return np.load(os.path.join(directory, name), mmap_mode='r')
+
+        cube = CountCube.read(os.path.join(directory, 'cube'))
+        if os.path.exists(os.path.join(directory, 'sketches.pickle')):
+            with open(os.path.join(directory, 'sketches.pickle'), 'rb') as f:
+                cube.sketches = pickle.load(f)
+        dates = DateIndex(mapped('dates.npy'), mapped('counts.npy'), mapped('age_sum.npy'), mapped('age_count.npy'))
+        if not os.path.exists(os.path.join(directory, 'rows.arrow')):
+            return Dataset(None, cube, None, dates, version)
+        rows = feather.read_table(os.path.join(directory, 'rows.arrow'), memory_map=True)
+        with open(os.path.join(directory, 'uniques.json')) as f:
+            uniques = {col: np.asarray(values, dtype=object if col in CATEGORY_COLUMNS else None)
+                       for col, values in json.load(f).items()}
+        index = RowIndex({col: mapped('codes-%s.npy' % col) for col in uniques}, uniques,
+                         {col: mapped('order-%s.npy' % col) for col in uniques},
+                         {col: mapped('bounds-%s.npy' % col) for col in uniques})
+        return Dataset(rows, cube, index, dates, version)
+
+    def refresh(self, url=API_URL):
+        """
+        This function publishes a new version when the snapshot is missing or stale. A
+        stale one is brought up to date as a delta on the published version. Concurrent
+        callers serialize on the lock, so the API is hit once and the others find a fresh
+        snapshot once they get the lock.
+        :return: the current version
+        """
+        with self.lock():
+            meta = read_meta(self.cache_dir)
+            version = self.current()
+            if version is not None and meta is not None and (OFFLINE or time.time() - meta['fetched_at'] < CACHE_TTL):
+                return version
+            if version is not None and meta is not None:
+                dataset = refresh_dataset(self.attach(version), url, self.cache_dir)
+            else:
+                dataset = load_dataset(url, cache_dir=self.cache_dir)
+            if dataset.version != version:
+                self.publish(dataset)
+            return dataset.version
+
+    def load(self, url=API_URL):
+        """
+        This function attaches to the current version, refreshing it first if needed
+        :return: Dataset
+        """
+        return self.attach(self.refresh(url))
+
+
+class FigureCache:
+    """
+    Thread-safe LRU cache of serialized figures keyed by (figure name, filter params,
+    dataset version). Least recently used figures are evicted once the cached JSON
+    exceeds max_bytes.
+    """
+
+    def __init__(self, max_bytes=FIGURE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._items:
+                return None
+            self._items.move_to_end(key)
+            return self._items[key]
+
+    def put(self, key, value):
+        with self._lock:
+            if key in self._items:
+                self.size -= len(self._items.pop(key))
+            self._items[key] = value
+            self.size += len(value)
+            while self.size > self.max_bytes and len(self._items) > 1:
+                _, evicted = self._items.popitem(last=False)
+                self.size -= len(evicted)
+
+    def get_or_build(self, key, build):
+        value = self.get(key)
+        if value is None:
+            value = build()
+            self.put(key, value)
+        return value
+
+
+class FigureStore:
+    """
+    Content-addressed files of serialized figures. Each figure is written once per
+    distinct JSON, named by its hash and stored next to gzip and, when the brotli module
+    is installed, brotli copies, so serving it is a file read with the hash, suffixed by
+    the encoding, as a strong ETag. Writes prune the store once they add up to an
+    eighth of its budget.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=FIGURE_STORE_BYTES):
+        self.root = os.path.join(cache_dir, 'figures')
+        self.max_bytes = max_bytes
+        self.written = 0
+        self._lock = threading.Lock()
+
+    def path(self, digest, encoding=None):
+        suffix = {None: '', 'gzip': '.gz', 'br': '.br'}[encoding]
+        return os.path.join(self.root, digest + '.json' + suffix)
+
+    def put(self, text):
+        """
+        This function stores a serialized figure unless it is already there
+        :param text: figure JSON string
+        :return: hex digest naming the figure
+        """
+        payload = text.encode()
+        digest = hashlib.sha256(payload).hexdigest()[:32]
+        try:
+            # a figure in use is kept by prune like a freshly written one
+            os.utime(self.path(digest))
+            return digest
+        except FileNotFoundError:
+            pass
+        os.makedirs(self.root, exist_ok=True)
+        encoded = {'gzip': gzip.compress(payload, compresslevel=9)}
+        if brotli is not None:
+            encoded['br'] = brotli.compress(payload)
+        # the plain file goes last, its presence marks a complete entry
+        for encoding, body in list(encoded.items()) + [(None, payload)]:
+            path = self.path(digest, encoding)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(body)
+            os.replace(path + '.tmp', path)
+        with self._lock:
+            self.written += len(payload) + sum(len(body) for body in encoded.values())
+            due = self.written * 8 > self.max_bytes
+            if due:
+                self.written = 0
+        if due:
+            self.prune()
+        return digest
+
+    def encoding_for(self, digest, accepted):
+        """
+        This function picks the smallest stored encoding the client accepts
+        :param digest: figure digest
+        :param accepted: werkzeug Accept-Encoding header
+        :return: 'br', 'gzip' or None
+        """
+        for encoding in ['br', 'gzip']:
+            if accepted[encoding] and os.path.exists(self.path(digest, encoding)):
+                return encoding
+        return None
+
+    def prune(self, max_bytes=None):
+        """
+        This function removes the least recently written or requested figures past
+        max_bytes. Other workers may prune the same files at the same time.
+        :param max_bytes: size to prune to, the store's budget by default
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        if not os.path.isdir(self.root):
+            return
+        entries = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            with contextlib.suppress(FileNotFoundError):
+                if not name.endswith('.tmp'):
+                    entries.append((os.stat(path), path))
+        entries.sort(key=lambda item: item[0].st_mtime)
+        total = sum(stat.st_size for stat, _ in entries)
+        for stat, path in entries:
+            if total <= max_bytes:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            total -= stat.st_size
+
+
+figure_cache = FigureCache()
+figure_store = FigureStore()
+shared_store = None
+_dataset = None
+_dataset_lock = threading.Lock()
+_update_lock = threading.Lock()
+_store_checked = 0.0
+
+
+def current_dataset():
+    """
+    This function loads the dataset on first use and returns the shared instance. In
+    serving mode it is attached from the shared store instead of loaded privately.
+    :return: Dataset
+    """
+    global _dataset
+    with _dataset_lock:
+        if _dataset is None:
+            _dataset = shared_store.load() if shared_store is not None else load_dataset()
+        return _dataset
+
+
+@app.server.before_request
+def follow_store():
+    """
+    This function re-attaches a serving process once the leader has published a new
+    version, looking at the store at most every STORE_POLL seconds. A version removed by
+    two quick publishes is skipped and the store looked at again on the next request.
+    """
+    global _dataset, _store_checked
+    if shared_store is None or time.time() - _store_checked < STORE_POLL:
+        return
+    _store_checked = time.time()
+    version = shared_store.current()
+    if version is not None and (_dataset is None or version != _dataset.version):
+        try:
+            dataset = shared_store.attach(version)
+        except FileNotFoundError:
+            _store_checked = 0
+            return
+        with _dataset_lock:
+            _dataset = dataset
+
+
+def start_leader(store, interval=None):
+    """
+    This function starts the refresh thread. Every serving process starts one, but only
+    the process holding the leader lock gets past it; if the leader dies its lock is
+    released and another process takes over.
+    :param store: SharedStore
+    :param interval: seconds between staleness checks
+    """
+    interval = interval or STORE_POLL
+
+    def lead():
+        with store.lock('leader.lock'):
+            while True:
+                time.sleep(interval)
+                try:
+                    store.refresh()
+                except Exception:
+                    # an API outage or a bad batch must not stop later refreshes
+                    app.server.logger.exception('shared store refresh failed')
+
+    thread = threading.Thread(target=lead, name='arrests-leader', daemon=True)
+    thread.start()
+    return thread
+
+
+def replace_dataset(dataset):
+    global _dataset
+    with _dataset_lock:
+        _dataset = dataset
+
+
+def apply_update(rows, deleted=()):
+    """
+    This function applies a batch of new, revised or deleted arrests to the served
+    dataset without reloading it and stores the result. In serving mode the batch is
+    published to the shared store, where the other processes pick it up. Connected
+    clients notice the new version on their next poll.
+    :param rows: DataFrame with the dashboard columns, as decode_page returns them
+    :param deleted: arrest codes to remove
+    :return: Dataset
+    """
+    rows = apply_schema(rows)
+    if shared_store is not None:
+        with shared_store.lock():
+            dataset = shared_store.attach().apply_delta(rows, deleted)
+            if dataset.version != shared_store.current():
+                if feather is not None:
+                    append_snapshot(rows, deleted, dataset.data, shared_store.cache_dir)
+                shared_store.publish(dataset)
+    else:
+        with _update_lock:
+            previous = current_dataset()
+            dataset = previous.apply_delta(rows, deleted)
+            if feather is not None and dataset is not previous:
+                append_snapshot(rows, deleted, dataset.data)
+    replace_dataset(dataset)
+    return dataset
+
+
+def start_refresher(interval=None):
+    """
+    This function starts the refresh thread of a single-process server, which applies
+    the upstream changes as a delta whenever the snapshot goes stale
+    :param interval: seconds between staleness checks
+    """
+    interval = interval or STORE_POLL
+
+    def refresh():
+        refreshed_at = time.time()
+        while True:
+            time.sleep(interval)
+            try:
+                meta = read_meta()
+                if OFFLINE or time.time() - (meta['fetched_at'] if meta else refreshed_at) < CACHE_TTL:
+                    continue
+                with _update_lock:
+                    replace_dataset(refresh_dataset(current_dataset()))
+                refreshed_at = time.time()
+            except Exception:
+                # an API outage or a bad batch must not stop later refreshes
+                app.server.logger.exception('dataset refresh failed')
+
+    thread = threading.Thread(target=refresh, name='arrests-refresher', daemon=True)
+    thread.start()
+    return thread
+
+
+def create_server(cache_dir=CACHE_DIR):
+    """
+    This function is the production entry point, run once in every pre-forked worker:
+        gunicorn --workers 4 'main:create_server()'
+    Workers attach to the memory-mapped shared store instead of each loading the data.
+    :param cache_dir: where the store lives
+    :return: Flask server
+    """
+    global shared_store, figure_store
+    shared_store = SharedStore(cache_dir)
+    figure_store = FigureStore(cache_dir)
+    figure_store.prune()
+    current_dataset()
+    start_leader(shared_store)
+    dash_layout()
+    return app.server
+
+
+def render_figure(name, params=(), frame=None):
+    """
+    This function returns the serialized figure, building it only on a cache miss
+    :param name: key of FIGURES
+    :param params: hashable filter parameters
+    :param frame: value of the animated column to render alone, None for every frame
+    :return: figure JSON string
+    """
+    dataset = current_dataset()
+    builder = FIGURES[name][1]
+
+    def build():
+        cube = dataset.cube_for(params)
+        with measured('build', figure=name) as sample:
+            figure = builder(cube) if frame is None else builder(cube, frame=frame)
+            sample['rows'] = len(cube)
+        return serialized(figure, name)
+
+    return figure_cache.get_or_build((name, params, frame, dataset.version), build)
+
+
+def serialized(figure, name):
+    """
+    This function serializes a figure, recording the time and size apart from building it
+    :param figure: plotly Figure
+    :param name: figure name for the metrics
+    :return: figure JSON string
+    """
+    with measured('serialize', figure=name) as sample:
+        text = figure.to_json()
+        sample['bytes'] = len(text)
+    return text
+
+
+def frame_values(name, params=()):
+    """
+    This function lists the frames of an animated figure under the current filters
+    :param name: key of FIGURES
+    :param params: hashable filter parameters
+    :return: sorted list of values of the animated column
+    """
+    dim = FIGURES[name][3]
+    return [value.item() for value in current_dataset().cube_for(params).rollup([dim])[dim].to_numpy()]
+
+
+prefetch_pool = ThreadPoolExecutor(max_workers=PREFETCH_WORKERS)
+
+
+def prefetch_frames(name, params, frames, frame):
+    """
+    This function renders and stores the frames following frame in the background, so
+    that playing the animation finds them already built
+    :param name: key of FIGURES
+    :param params: hashable filter parameters
+    :param frames: every frame value, in order
+    :param frame: the frame just shown
+    """
+    position = frames.index(frame)
+    for upcoming in (frames * 2)[position + 1:position + 1 + min(PREFETCH_FRAMES, len(frames) - 1)]:
+        prefetch_pool.submit(lambda value: figure_store.put(render_figure(name, params, value)), upcoming)
+
+
+def render_trend(params, start, end, freq, window):
+    """
+    This function returns the serialized date trend, building it only on a cache miss
+    :return: figure JSON string
+    """
+    dataset = current_dataset()
+    key = ('date_trend', params + (('dates', (start, end, freq, window)),), dataset.version)
+
+    def build():
+        dates = dataset.dates_for(params)
+        with measured('build', figure='date_trend'):
+            figure = date_trend(dates, start, end, freq, window)
+        return serialized(figure, 'date_trend')
+
+    return figure_cache.get_or_build(key, build)
+
+
+def figure_url(text):
+    """
+    This function publishes a serialized figure and returns its immutable URL
+    :param text: figure JSON string
+    :return: URL path
+    """
+    return '/figures/%s.json' % figure_store.put(text)
+
+
+def figure_response(digest, cache_control):
+    """
+    This function answers a figure request with a 304 when the client already holds the
+    digest in any encoding, or with the best precompressed copy otherwise. Each encoding
+    has its own strong ETag, the digest suffixed by '-gzip' or '-br'.
+    :param digest: figure digest
+    :param cache_control: Cache-Control header value
+    :return: flask Response
+    """
+    if not re.fullmatch('[0-9a-f]{32}', digest) or not os.path.exists(figure_store.path(digest)):
+        abort(404)
+    encoding = figure_store.encoding_for(digest, request.accept_encodings)
+    etag = digest if encoding is None else '%s-%s' % (digest, encoding)
+    if any(request.if_none_match.contains_weak(tag) for tag in [digest, digest + '-gzip', digest + '-br']):
+        response = app.server.response_class(status=304)
+    else:
+        try:
+            response = send_file(figure_store.path(digest, encoding), mimetype='application/json',
+                                 etag=False, conditional=False)
+        except FileNotFoundError:
+            # pruned by another worker since the check above
+            abort(404)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = cache_control
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@app.server.route('/figures/<digest>.json')
+def serve_figure(digest):
+    """Figures by digest never change, so clients and proxies may keep them forever"""
+    return figure_response(digest, 'public, max-age=31536000, immutable')
+
+
+@app.server.route('/figures/by-name/<name>.json')
+def serve_named_figure(name):
+    """The unfiltered figure for the current dataset, revalidated on every use"""
+    if name not in FIGURES:
+        abort(404)
+    return figure_response(figure_store.put(render_figure(name)), 'public, no-cache')
+
+
+class StackSampler:
+    """
+    Background thread sampling the stack of one thread every interval seconds and
+    counting identical stacks, written in the collapsed format flame graph tools read
+    """
+
+    def __init__(self, thread_id, interval=PROFILE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name='arrests-profiler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append('%s (%s:%d)' % (code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.counts[key] = self.counts.get(key, 0) + 1
+
+    def stop(self):
+        self._done.set()
+        self._thread.join()
+        return self.counts
+
+    def dump(self, path):
+        """
+        This function writes the sampled stacks, one 'frame;frame;frame count' line each
+        :param path: output file
+        """
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write('%s %d\n' % (stack, count))
+
+
+@app.server.before_request
+def start_request_metrics():
+    """
+    This function times every request and, when PROFILE_DIR is set, starts sampling the
+    stack of the thread serving it
+    """
+    g.request_started = time.perf_counter()
+    if PROFILE_DIR and request.endpoint != 'serve_metrics':
+        g.profiler = StackSampler(threading.get_ident()).start()
+
+
+@app.server.teardown_request
+def finish_request_metrics(error=None):
+    """
+    This function records the request and writes its profile. Dash callbacks share one
+    endpoint, so their profiles are named after the outputs they update.
+    """
+    if 'request_started' not in g:
+        return
+    seconds = time.perf_counter() - g.request_started
+    endpoint = request.endpoint or 'unknown'
+    metrics.observe('arrests_http_request_seconds', seconds, endpoint=endpoint)
+    metrics.inc('arrests_http_responses_total', endpoint=endpoint,
+                status=500 if error is not None else g.get('response_status', 0))
+    profiler = g.pop('profiler', None)
+    if profiler is None or not profiler.stop():
+        return
+    name = request.path
+    if request.is_json:
+        name += '-' + str((request.get_json(silent=True) or {}).get('output', ''))
+    name = re.sub('[^A-Za-z0-9]+', '_', name).strip('_')[:80]
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    profiler.dump(os.path.join(PROFILE_DIR, '%d-%s-%dms.folded' % (time.time_ns(), name, seconds * 1000)))
+
+
+@app.server.after_request
+def keep_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+
+@app.server.route('/metrics')
+def serve_metrics():
+    """Counters and histograms of this process for Prometheus to scrape"""
+    return app.server.response_class(metrics.exposition(), mimetype='text/plain; version=0.0.4')
+
+
+def filter_params(years, **selected):
+    """
+    This function turns the filter controls into canonical, hashable params, leaving out
+    controls that do not restrict anything
+    :param years: [low, high] from the year slider
+    :param selected: column -> list of chosen values
+    :return: tuple of (column, values) pairs
+    """
+    params = []
+    if not current_dataset().filterable:
+        return ()
+    all_years = current_dataset().values('year_of_arrest')
+    if years and (years[0] > min(all_years) or years[1] < max(all_years)):
+        params.append(('year_of_arrest', (int(years[0]), int(years[1]))))
+    for col in FILTER_COLUMNS:
+        if selected.get(col):
+            params.append((col, tuple(sorted(selected[col]))))
+    return tuple(params)
+
+
+_worker_cube = None
+
+
+def init_builder_worker(path, tables, sketches=None):
+    """
+    This function runs once in every prebuild worker and attaches the count cube, by
+    memory-mapping its Arrow files when there are some. A worker only decodes the tables
+    its figures roll up from.
+    :param path: directory of the cube's Arrow IPC files, or None
+    :param tables: cube tables to use when there are no files
+    :param sketches: Sketches of the cube in sketch mode
+    """
+    global _worker_cube
+    if path is not None:
+        _worker_cube = CountCube.read(path, sketches)
+    else:
+        _worker_cube = CountCube(tables, sketches)
+
+
+def build_in_worker(task):
+    """
+    This function builds one figure, or one frame of an animated one, in a prebuild worker
+    :param task: (key of FIGURES, value of the animated column or None for the whole figure)
+    :return: (task, figure JSON string, sorted dimensions of the rollups it read)
+    """
+    name, frame = task
+    builder = FIGURES[name][1]
+    _worker_cube.reads = set()
+    figure = builder(_worker_cube) if frame is None else builder(_worker_cube, frame=frame)
+    return task, figure.to_json(), sorted(_worker_cube.reads)
+
+
+@instrumented('prebuild')
+def prebuild_figures(dataset, names=None, max_workers=None, cache_dir=CACHE_DIR, frames=True, reads=None):
+    """
+    This function builds figures in parallel on a process pool. The cube is written once
+    as uncompressed Arrow files that every worker memory-maps, so nothing but figure
+    names and JSON crosses process boundaries. Without pyarrow the cube is pickled to
+    each worker instead. By default animated figures are built a frame at a time and
+    everything is stored in the figure cache under the keys show_figure asks for; with
+    frames off the whole animations are built and only returned.
+    :param dataset: Dataset
+    :param names: figures to build, all of them by default
+    :param max_workers: pool size, the CPU count by default
+    :param cache_dir: where the cube files are written
+    :param frames: whether to build the single frames the dashboard shows
+    :param reads: dict filled with the dimensions of the rollups each build read, if given
+    :return: dict of (figure name, frame value or None) -> figure JSON string
+    """
+    tasks = []
+    for name in names or FIGURES:
+        dim = FIGURES[name][3]
+        if frames and dim is not None:
+            tasks += [(name, value.item()) for value in dataset.cube.rollup([dim])[dim].to_numpy()]
+        else:
+            tasks.append((name, None))
+    path = None
+    tables = dataset.cube.tables
+    if feather is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        suffix = '' if dataset.cube.sketches is None else '-sketch'
+        path = os.path.join(cache_dir, 'cube-%s%s' % (dataset.version, suffix))
+        if not os.path.exists(path):
+            for stale in glob.glob(os.path.join(cache_dir, 'cube-*')):
+                shutil.rmtree(stale, ignore_errors=True)
+            dataset.cube.write(path + '.tmp')
+            os.replace(path + '.tmp', path)
+        tables = None
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_builder_worker,
+                             initargs=(path, tables, dataset.cube.sketches)) as pool:
+        figures = {}
+        for task, text, rolled in pool.map(build_in_worker, tasks):
+            figures[task] = text
+            if reads is not None:
+                reads[task] = rolled
+    if frames:
+        for (name, frame), text in figures.items():
+            figure_cache.put((name, (), frame, dataset.version), text)
+    return figures
+
+
+@functools.lru_cache(maxsize=None)
+def object_source(obj):
+    # getsource parses the whole module to find a class, remember what it found
+    return inspect.getsource(obj)
+
+
+def source_closure(*roots):
+    """
+    This function collects the source of the given functions and classes together with
+    every function, class and plain constant of this module they reach by name, so that
+    editing any of them changes the result
+    :param roots: functions or classes of this module
+    :return: str
+    """
+    module = sys.modules[__name__]
+    parts = {}
+    stack = list(roots)
+    while stack:
+        obj = inspect.unwrap(stack.pop())
+        if obj.__name__ in parts:
+            continue
+        parts[obj.__name__] = object_source(obj)
+        if inspect.isclass(obj):
+            members = [getattr(value, '__func__', None) or getattr(value, 'fget', None) or value
+                       for value in vars(obj).values()]
+            codes = [inspect.unwrap(member).__code__ for member in members if hasattr(inspect.unwrap(member), '__code__')]
+        else:
+            codes = [obj.__code__]
+        while codes:
+            code = codes.pop()
+            codes.extend(const for const in code.co_consts if inspect.iscode(const))
+            for name in code.co_names:
+                target = getattr(module, name, None)
+                if (inspect.isfunction(target) or inspect.isclass(target)) and target.__module__ == __name__:
+                    stack.append(target)
+                elif isinstance(target, (int, float, str, tuple, list, dict)) and name not in parts:
+                    parts[name] = repr(target)
+    return ''.join(parts[name] for name in sorted(parts))
+
+
+def rollup_digest(cube, reads):
+    """
+    This function hashes the rollups a figure read, and the sketches in sketch mode, so
+    that an export rebuilds a chart only when the numbers behind it change
+    :param cube: CountCube
+    :param reads: list of the dimension lists the figure rolled up
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    for dims in reads:
+        digest.update(repr(tuple(dims)).encode())
+        digest.update(pd.util.hash_pandas_object(cube.rollup(list(dims)), index=False).to_numpy().tobytes())
+    if cube.sketches is not None:
+        digest.update(pickle.dumps(cube.sketches))
+    return digest.hexdigest()
+
+
+def write_exported(path, body, compressed=True):
+    """
+    This function atomically writes an exported file, next to gzip and, when the brotli
+    module is installed, brotli copies for file servers that serve precompressed files
+    :param path: output file
+    :param body: bytes
+    :param compressed: whether to write the compressed copies
+    """
+    encoded = [('', body)]
+    if compressed:
+        encoded.append(('.gz', gzip.compress(body, compresslevel=9, mtime=0)))
+        if brotli is not None:
+            encoded.append(('.br', brotli.compress(body)))
+    for suffix, content in encoded:
+        with open(path + suffix + '.tmp', 'wb') as f:
+            f.write(content)
+        os.replace(path + suffix + '.tmp', path + suffix)
+
+
+def content_name(prefix, body, extension):
+    return '%s-%s.%s' % (prefix, hashlib.sha256(body).hexdigest()[:16], extension)
+
+
+EXPORT_PAGE = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{heading}</title>
+<script src="{plotly}"></script>
+</head>
+<body>
+<p><a href="index.html">All charts</a></p>
+<h1 style="text-align: center; margin-top: 40px; margin-bottom: 40px">{heading}</h1>
+<div id="figure" style="{style}"></div>
+<script>
+Promise.all([fetch("{figure}"), fetch("{template}")].map(function(request) {{
+    return request.then(function(response) {{ return response.json(); }});
+}})).then(function(parts) {{
+    var figure = parts[0];
+    figure.layout.template = parts[1];
+    Plotly.newPlot("figure", figure);
+}});
+</script>
+</body>
+</html>
+"""
+
+EXPORT_INDEX = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Urbana Police Arrests</title>
+</head>
+<body>
+<h1>Urbana Police Arrests</h1>
+<ul>
+{links}
+</ul>
+</body>
+</html>
+"""
+
+
+@instrumented('export')
+def export_site(dataset, out_dir, max_workers=None, cache_dir=CACHE_DIR):
+    """
+    This function writes the dashboard as a static site: an HTML page per chart loading
+    a shared plotly.js and the figure JSON with its template split off, since every
+    figure carries the same one. Assets are named by their content hash and stored
+    precompressed. Each chart is rebuilt, in parallel, only when the hash of its builder
+    code, the constants it reads and the cube rollups it read last time differs from the
+    last export, or one of its files is gone.
+    :param dataset: Dataset
+    :param out_dir: site directory
+    :param max_workers: build processes, the CPU count by default
+    :param cache_dir: where prebuild writes the shared cube file
+    :return: dict of built and skipped chart names
+    """
+    figures_dir = os.path.join(out_dir, 'figures')
+    os.makedirs(figures_dir, exist_ok=True)
+    manifest_path = os.path.join(out_dir, 'manifest.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    plotly_js = plotly.offline.get_plotlyjs().encode()
+    plotly_name = content_name('plotly', plotly_js, 'min.js')
+    if not os.path.exists(os.path.join(out_dir, plotly_name)):
+        write_exported(os.path.join(out_dir, plotly_name), plotly_js)
+
+    charts = OrderedDict((name, (heading, style, [builder, CountCube, SketchStream]))
+                         for name, (heading, builder, style, _) in FIGURES.items())
+    charts['date_trend'] = ('Arrests over time', {}, [date_trend, DateIndex])
+    code = {name: source_closure(*roots) + plotly.__version__ for name, (_, _, roots) in charts.items()}
+
+    def inputs(name, reads):
+        digest = hashlib.sha256(code[name].encode())
+        if name == 'date_trend':
+            for values in [dataset.dates.dates, dataset.dates.counts, dataset.dates.age_sum, dataset.dates.age_count]:
+                digest.update(np.ascontiguousarray(values).tobytes())
+        else:
+            digest.update(rollup_digest(dataset.cube, reads).encode())
+        return digest.hexdigest()
+
+    def exported(name):
+        entry = manifest.get(name)
+        return (entry is not None and 'reads' in entry and entry['inputs'] == inputs(name, entry['reads'])
+                and all(os.path.exists(os.path.join(out_dir, entry[key])) for key in ['figure', 'template']))
+
+    stale = [name for name in charts if not exported(name)]
+
+    names = [name for name in stale if name in FIGURES]
+    texts, reads = {}, {'date_trend': []}
+    if names:
+        rolled = {}
+        built = prebuild_figures(dataset, names, max_workers, cache_dir, frames=False, reads=rolled)
+        texts = {name: text for (name, _), text in built.items()}
+        reads.update({name: [list(dims) for dims in dims_read] for (name, _), dims_read in rolled.items()})
+    if 'date_trend' in stale:
+        first, last = dataset.dates.first(), dataset.dates.last()
+        texts['date_trend'] = date_trend(dataset.dates, first, last, 'M', 3).to_json()
+    for name in stale:
+        figure = json.loads(texts[name])
+        template = json.dumps(figure['layout'].pop('template', {}), separators=(',', ':')).encode()
+        body = json.dumps(figure, separators=(',', ':')).encode()
+        entry = {'inputs': inputs(name, reads[name]), 'reads': reads[name],
+                 'figure': 'figures/' + content_name(name, body, 'json'),
+                 'template': 'figures/' + content_name('template', template, 'json')}
+        for key, content in [('figure', body), ('template', template)]:
+            if not os.path.exists(os.path.join(out_dir, entry[key])):
+                write_exported(os.path.join(out_dir, entry[key]), content)
+        manifest[name] = entry
+
+    for name, (heading, style, _) in charts.items():
+        css = '; '.join('%s: %s' % (key, '%dpx' % value if isinstance(value, int) else value)
+                        for key, value in style.items())
+        page = EXPORT_PAGE.format(heading=escape(heading), plotly=plotly_name, style=css,
+                                  figure=manifest[name]['figure'], template=manifest[name]['template'])
+        write_exported(os.path.join(out_dir, name + '.html'), page.encode())
+    links = '\n'.join('<li><a href="%s.html">%s</a></li>' % (name, escape(heading))
+                      for name, (heading, _, _) in charts.items())
+    write_exported(os.path.join(out_dir, 'index.html'), EXPORT_INDEX.format(links=links).encode())
+    manifest = {name: manifest[name] for name in charts}
+    with open(manifest_path + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    # drop assets no page refers to any more
+    used = {os.path.basename(entry[key]) for entry in manifest.values() for key in ['figure', 'template']}
+    for path in glob.glob(os.path.join(figures_dir, '*.json*')):
+        if os.path.basename(path).split('.json')[0] + '.json' not in used:
+            os.remove(path)
+    for path in glob.glob(os.path.join(out_dir, 'plotly-*.min.js*')):
+        if not os.path.basename(path).startswith(plotly_name):
+            os.remove(path)
+    return {'built': stale, 'skipped': [name for name in charts if name not in stale]}
+
+
+def year_slider(years):
+    """
+    This function sets the year filter's range and marks from the years present
+    :param years: list of years
+    :return: dict of min, max and marks
+    """
+    years = [int(year) for year in years]
+    return {'min': min(years), 'max': max(years), 'marks': {year: str(year) for year in years if year % 5 == 0}}
+
+
+def filter_controls(dataset):
+    """
+    This function builds the filter panel from the values present in the dataset,
+    disabled for a sketched dataset
+    :param dataset: Dataset
+    :return: html.Div
+    """
+    slider = year_slider(dataset.values('year_of_arrest'))
+    disabled = not dataset.filterable
+    return html.Div(children=[
+        dcc.RangeSlider(id='year_filter', step=1, value=[slider['min'], slider['max']], disabled=disabled, **slider),
+    ] + [
+        dcc.Dropdown(id=col + '_filter', options=dataset.values(col), multi=True, placeholder=label, disabled=disabled)
+        for col, label in FILTER_DROPDOWNS
+    ])
+
+
+def trend_controls(dates):
+    """
+    This function builds the date trend panel
+    :param dates: DateIndex
+    :return: html.Div
+    """
+    first, last = dates.first(), dates.last()
+    return html.Div(children=[
+        html.H1(id='trend_heading', children='Arrests over time', style=HEADING_STYLE),
+        dcc.DatePickerRange(id='trend_dates', min_date_allowed=first.date(), max_date_allowed=last.date(),
+                            start_date=first.date(), end_date=last.date()),
+        dcc.RadioItems(id='trend_freq', value='M', inline=True,
+                       options=[{'label': 'Daily', 'value': 'D'}, {'label': 'Weekly', 'value': 'W'},
+                                {'label': 'Monthly', 'value': 'M'}]),
+        dcc.Slider(id='trend_window', min=1, max=12, step=1, value=3),
+        dcc.Store(id='trend_url'),
+        dcc.Graph(id='trend_graph'),
+    ])
+
+
+def serve_layout():
+    """
+    This function lays the dashboard out as a filter panel, the date trend and one tab
+    per figure. Figures are rendered by show_figure when their tab is first opened and
+    again when the dataset version the page polls for moves on.
+    """
+    dataset = current_dataset()
+    return html.Div(children=[
+        filter_controls(dataset),
+        trend_controls(dataset.dates),
+        dcc.Store(id='dataset_version', data=dataset.version),
+        dcc.Interval(id='version_timer', interval=STORE_POLL * 1000),
+        dcc.Tabs(id='figure_tabs', value=next(iter(FIGURES)),
+                 children=[dcc.Tab(label=heading, value=name) for name, (heading, _, _, _) in FIGURES.items()]),
+        html.H1(id='figure_heading', style=HEADING_STYLE),
+        html.Div(id='frame_panel', style={'display': 'none'}, children=[
+            html.Button(id='frame_play', children='Play', n_clicks=0),
+            dcc.Slider(id='frame_slider', min=0, max=0, step=None, value=None, marks={}),
+            dcc.Interval(id='frame_timer', interval=1000, disabled=True),
         ]),
-        ([
-            html.H1(id='H3', children='Count of People arrested vs Arrest Resolution',
-                    style={'textAlign': 'center', 'marginTop': 40, 'marginBottom': 40}),
-            dcc.Graph(id='bar_chart', figure=age_resolution(age_df), style={'width': 1500, 'height': 1000})
-        ])
-    ]
-    )
+        dcc.Store(id='figure_url'),
+        dcc.Graph(id='figure_graph'),
+    ])
+
+
+def dash_layout():
+    app.layout = serve_layout
+
+
+@app.callback(Output('figure_heading', 'children'),
+              Output('figure_url', 'data'),
+              Output('figure_graph', 'style'),
+              Output('frame_panel', 'style'),
+              Output('frame_slider', 'min'),
+              Output('frame_slider', 'max'),
+              Output('frame_slider', 'marks'),
+              Output('frame_slider', 'value'),
+              Input('figure_tabs', 'value'),
+              Input('frame_slider', 'value'),
+              Input('year_filter', 'value'),
+              Input('crime_category_desc_filter', 'value'),
+              Input('arrest_res_filter', 'value'),
+              Input('arrestee_sex_filter', 'value'),
+              Input('arrestee_race_filter', 'value'),
+              Input('dataset_version', 'data'))
+@instrumented('callback', callback='show_figure')
+def show_figure(name, frame=None, years=None, categories=None, resolutions=None, sexes=None, races=None,
+                version=None):
+    """
+    Animated figures are sent one frame at a time: the slider picks the frame, a new tab
+    or filter starts again from the first one, and the next frames are prefetched.
+    """
+    heading, _, style, dim = FIGURES[name]
+    params = filter_params(years, crime_category_desc=categories, arrest_res=resolutions,
+                           arrestee_sex=sexes, arrestee_race=races)
+    if dim is None:
+        return heading, figure_url(render_figure(name, params)), style, {'display': 'none'}, 0, 0, {}, None
+    frames = frame_values(name, params)
+    if not frames:
+        return heading, figure_url(render_figure(name, params)), style, {'display': 'none'}, 0, 0, {}, None
+    if dash.callback_context.triggered_id not in ('frame_slider', 'dataset_version') or frame not in frames:
+        frame = frames[0]
+    text = render_figure(name, params, frame)
+    prefetch_frames(name, params, frames, frame)
+    marks = {value: str(value) for value in frames}
+    return heading, figure_url(text), style, {'display': 'block'}, frames[0], frames[-1], marks, frame
+
+
+# figures travel over plain GETs of their immutable URL, so the browser cache and any
+# proxy in between keep them across page loads
+FETCH_FIGURE = """
+function(url) {
+    if (!url) {
+        return window.dash_clientside.no_update;
+    }
+    return fetch(url).then(function(response) { return response.json(); });
+}
+"""
+app.clientside_callback(FETCH_FIGURE, Output('figure_graph', 'figure'), Input('figure_url', 'data'))
+app.clientside_callback(FETCH_FIGURE, Output('trend_graph', 'figure'), Input('trend_url', 'data'))
+app.clientside_callback(
+    """
+    function(clicks) {
+        var playing = clicks % 2 === 1;
+        return [!playing, playing ? 'Pause' : 'Play'];
+    }
+    """,
+    Output('frame_timer', 'disabled'), Output('frame_play', 'children'),
+    Input('frame_play', 'n_clicks'), prevent_initial_call=True)
+app.clientside_callback(
+    """
+    function(ticks, value, marks) {
+        var frames = Object.keys(marks || {}).map(Number).sort(function(a, b) { return a - b; });
+        if (!frames.length) {
+            return window.dash_clientside.no_update;
+        }
+        var next = frames.find(function(frame) { return frame > value; });
+        return next === undefined ? frames[0] : next;
+    }
+    """,
+    Output('frame_slider', 'value', allow_duplicate=True),
+    Input('frame_timer', 'n_intervals'), State('frame_slider', 'value'), State('frame_slider', 'marks'),
+    prevent_initial_call=True)
+
+
+@app.callback(Output('trend_url', 'data'),
+              Input('trend_dates', 'start_date'),
+              Input('trend_dates', 'end_date'),
+              Input('trend_freq', 'value'),
+              Input('trend_window', 'value'),
+              Input('year_filter', 'value'),
+              Input('crime_category_desc_filter', 'value'),
+              Input('arrest_res_filter', 'value'),
+              Input('arrestee_sex_filter', 'value'),
+              Input('arrestee_race_filter', 'value'),
+              Input('dataset_version', 'data'))
+@instrumented('callback', callback='show_trend')
+def show_trend(start, end, freq, window, years=None, categories=None, resolutions=None, sexes=None, races=None,
+               version=None):
+    params = filter_params(years, crime_category_desc=categories, arrest_res=resolutions,
+                           arrestee_sex=sexes, arrestee_race=races)
+    return figure_url(render_trend(params, start[:10], end[:10], freq, window))
+
+
+@app.callback(Output('trend_dates', 'start_date'),
+              Output('trend_dates', 'end_date'),
+              Input('trend_graph', 'relayoutData'),
+              prevent_initial_call=True)
+@instrumented('callback', callback='zoom_trend')
+def zoom_trend(relayout):
+    """Zooming the trend chart narrows the date range, which re-resamples the zoomed window"""
+    if not relayout or 'xaxis.range[0]' not in relayout:
+        raise dash.exceptions.PreventUpdate
+    return relayout['xaxis.range[0]'][:10], relayout['xaxis.range[1]'][:10]
+
+
+@app.callback(Output('dataset_version', 'data'),
+              Output('year_filter', 'min'),
+              Output('year_filter', 'max'),
+              Output('year_filter', 'marks'),
+              Output('year_filter', 'value'),
+              *[Output(col + '_filter', 'options') for col, _ in FILTER_DROPDOWNS],
+              Output('trend_dates', 'max_date_allowed'),
+              Output('trend_dates', 'end_date', allow_duplicate=True),
+              Input('version_timer', 'n_intervals'),
+              State('dataset_version', 'data'),
+              State('year_filter', 'value'),
+              State('year_filter', 'max'),
+              State('trend_dates', 'end_date'),
+              State('trend_dates', 'max_date_allowed'),
+              prevent_initial_call=True)
+@instrumented('callback', callback='follow_version')
+def follow_version(ticks, known, years, last_year, end, last_date):
+    """
+    Pages poll the dataset version. Once it moves on, the filters take in the new values
+    and ranges that reached the old end are stretched to the new one; the version store
+    re-renders the open figure and the trend.
+    """
+    dataset = current_dataset()
+    if dataset.version == known:
+        raise dash.exceptions.PreventUpdate
+    slider = year_slider(dataset.values('year_of_arrest'))
+    if years and years[1] >= last_year:
+        years = [years[0], slider['max']]
+    last = dataset.dates.last().date().isoformat()
+    if end and last_date and end[:10] >= last_date[:10]:
+        end = last
+    options = [dataset.values(col) for col, _ in FILTER_DROPDOWNS]
+    return (dataset.version, slider['min'], slider['max'], slider['marks'], years) + tuple(options) + (last, end)
 
 
 if __name__ == '__main__':
-    age_df = preprocess(get_data())
+    parser = argparse.ArgumentParser(description='Urbana Police Arrests dashboard')
+    parser.add_argument('--prebuild', action='store_true',
+                        help='build every figure on a process pool before serving')
+    parser.add_argument('--sketch', action='store_true',
+                        help='chart only the top crime types and home cities from bounded-memory sketches')
+    parser.add_argument('--export', metavar='DIR',
+                        help='write every chart as a static site to DIR instead of serving')
+    parser.add_argument('--workers', type=int, help='build processes for --prebuild and --export')
+    args = parser.parse_args()
+    SKETCH_MODE = SKETCH_MODE or args.sketch
+    dataset = current_dataset()
+    if args.export:
+        exported = export_site(dataset, args.export, args.workers)
+        print('%d charts built, %d unchanged, site in %s' % (len(exported['built']), len(exported['skipped']),
+                                                             args.export))
+        sys.exit(0)
+    figure_store.prune()
+    if args.prebuild:
+        prebuild_figures(dataset, max_workers=args.workers)
+    start_refresher()
     dash_layout()
-    app.run_server(debug=False)
+    app.run(debug=False)
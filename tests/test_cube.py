@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+import main
+
+
+def arrests(n, seed=0, first_code=0):
+    data = benchmark.synthetic_arrests(n, seed)
+    data['arrest_code'] = ['%08d' % code for code in range(first_code, first_code + n)]
+    return data
+
+
+def cells(table, dims):
+    """
+    Cells of a cube table or rollup as a dict, missing keys as None and empty cells left out
+    """
+    keys = zip(*[[None if pd.isna(value) else value for value in table[dim]] for dim in dims])
+    return {key: (count, age_count, round(age_sum, 6))
+            for key, count, age_count, age_sum in zip(keys, table['count'], table['age_count'], table['age_sum'])
+            if count}
+
+
+def assert_same_cube(cube, expected):
+    for dims in main.CUBE_TABLES:
+        assert cells(cube.table(dims), dims) == cells(expected.table(dims), dims), dims
+
+
+@pytest.fixture(scope='module')
+def raw():
+    return arrests(4000, 1)
+
+
+def test_rollups_match_a_groupby_over_the_rows(raw):
+    data = main.apply_schema(raw)
+    cube = main.CountCube.from_data(data)
+    groupings = [[dim] for dim in main.CUBE_DIMENSIONS]
+    groupings += [list(dims) for dims in main.CUBE_TABLES if 'age_class' not in dims]
+    for dims in groupings:
+        expected = data.groupby(dims, observed=True).agg(count=('age_at_arrest', 'size'),
+                                                         age_sum=('age_at_arrest', 'sum'),
+                                                         age_count=('age_at_arrest', 'count')).reset_index()
+        assert cells(cube.rollup(dims), dims) == cells(expected, dims), dims
+
+
+def test_rollup_of_dimensions_no_table_holds_fails(raw):
+    with pytest.raises(KeyError):
+        main.CountCube.from_data(main.apply_schema(raw)).rollup(['arrestee_sex', 'arrest_res'])
+
+
+@pytest.mark.parametrize('bins, right', [
+    ([0, 18, 99], True),
+    ([0, 30, 50, 99], True),
+    ([0, 17, 55, 99], True),
+    ([0, 13, 20, 50, 110], False),
+    (main.AGE_CATEGORY_BINS, False),
+    (main.AGE_CATEGORY_BINS, True),
+])
+def test_binned_ages_match_binning_the_rows(raw, bins, right):
+    data = raw.copy()
+    # ages on and between every edge, outside the edges and missing
+    probes = [edge + offset for edge in main.AGE_EDGES for offset in (-0.5, 0, 0.25)] + [-3, 150, np.nan]
+    data.loc[:len(probes) - 1, 'age_at_arrest'] = probes
+    data = main.apply_schema(data)
+    labels = ['bin %d' % number for number in range(len(bins) - 1)]
+    binned = main.CountCube.from_data(data).binned_ages(['arrest_res'], 'age_bin', bins, labels, right=right)
+    expected = data.groupby(['arrest_res', pd.cut(data['age_at_arrest'], bins, labels=labels, right=right)
+                             .rename('age_bin')], observed=True).agg(count=('age_at_arrest', 'size'),
+                                                                     age_sum=('age_at_arrest', 'sum'),
+                                                                     age_count=('age_at_arrest', 'count'))
+    assert cells(binned, ['arrest_res', 'age_bin']) == cells(expected.reset_index(), ['arrest_res', 'age_bin'])
+
+
+def test_binned_ages_reject_bins_outside_the_edges(raw):
+    cube = main.CountCube.from_data(main.apply_schema(raw))
+    with pytest.raises(ValueError):
+        cube.binned_ages([], 'age_bin', [0, 21, 99], ['young', 'old'])
+
+
+def test_apply_delta_matches_a_rebuild(raw):
+    base = raw.iloc[:3000]
+    added = raw.iloc[3000:]
+    revised = base.iloc[100:200].assign(age_at_arrest=base['age_at_arrest'].iloc[100:200] + 1,
+                                        arrestee_home_city='NEWTOWN')
+    removed = base.iloc[100:300]
+    cube = main.CountCube.from_data(main.apply_schema(base)).apply_delta(
+        main.apply_schema(pd.concat([added, revised])), main.apply_schema(removed))
+    expected = main.CountCube.from_data(main.apply_schema(pd.concat([base.drop(removed.index), added, revised])))
+    assert_same_cube(cube, expected)
+
+
+def test_deltas_in_any_order_match_a_rebuild(raw):
+    data = main.apply_schema(raw)
+    chunks = np.array_split(np.random.default_rng(3).permutation(len(data)), 5)
+    cube = main.CountCube.from_data(data.iloc[chunks[0]])
+    for chunk in chunks[1:]:
+        cube = cube.apply_delta(data.iloc[chunk], data.iloc[:0])
+    cube = cube.apply_delta(data.iloc[:0], data.iloc[chunks[2]])
+    expected = main.CountCube.from_data(data.drop(data.index[chunks[2]]))
+    assert_same_cube(cube, expected)
+
+
+def test_retracting_every_row_empties_the_cube(raw):
+    data = main.apply_schema(raw)
+    cube = main.CountCube.from_data(data).apply_delta(data.iloc[:0], data)
+    assert len(cube) == 0
+    assert cube.rollup(['year_of_arrest']).empty
+
+
+def test_empty_delta_returns_the_same_cube(raw):
+    data = main.apply_schema(raw)
+    cube = main.CountCube.from_data(data)
+    assert cube.apply_delta(data.iloc[:0], data.iloc[:0]) is cube
+
+
+def test_written_cube_reads_back_mapped(raw, tmp_path):
+    pytest.importorskip('pyarrow')
+    cube = main.CountCube.from_data(main.apply_schema(raw))
+    cube.write(str(tmp_path))
+    read = main.CountCube.read(str(tmp_path))
+    assert not any(isinstance(table, pd.DataFrame) for table in read.tables.values())
+    assert len(read) == len(cube)
+    assert_same_cube(read, cube)
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+from test_cube import arrests, assert_same_cube
+
+pytest.importorskip('pyarrow')
+
+
+@pytest.fixture
+def raw():
+    return arrests(3000, 5)
+
+
+def changes(raw):
+    """
+    New arrests, revised copies of stored ones, unchanged copies and deleted codes
+    """
+    added = arrests(200, 6, first_code=len(raw))
+    revised = raw.iloc[10:60].assign(age_at_arrest=raw['age_at_arrest'].iloc[10:60] + 2, arrest_res='BOND')
+    unchanged = raw.iloc[500:520]
+    deleted = list(raw['arrest_code'].iloc[900:930])
+    return pd.concat([added, revised, unchanged], ignore_index=True), deleted
+
+
+def expected_rows(raw, rows, deleted):
+    kept = raw[~raw['arrest_code'].isin(list(rows['arrest_code']) + deleted)]
+    return pd.concat([kept, rows], ignore_index=True)
+
+
+def sorted_rows(data):
+    data = data.astype({col: object for col in main.CATEGORY_COLUMNS})
+    return data.sort_values('arrest_code', ignore_index=True)
+
+
+def test_dataset_delta_matches_a_rebuild(raw):
+    rows, deleted = changes(raw)
+    dataset = main.Dataset.from_data(main.apply_schema(raw))
+    updated = dataset.apply_delta(main.apply_schema(rows), deleted)
+    expected = main.Dataset.from_data(main.apply_schema(expected_rows(raw, rows, deleted)))
+    assert updated.version != dataset.version
+    pd.testing.assert_frame_equal(sorted_rows(updated.data), sorted_rows(expected.data), check_dtype=False)
+    assert_same_cube(updated.cube, expected.cube)
+    assert_same_dates(updated.dates, expected.dates)
+
+
+def assert_same_dates(dates, expected):
+    np.testing.assert_array_equal(dates.dates, expected.dates)
+    for name in ['counts', 'age_count']:
+        np.testing.assert_array_equal(getattr(dates, name), getattr(expected, name))
+    np.testing.assert_allclose(dates.age_sum, expected.age_sum)
+
+
+def test_chained_deltas_match_a_rebuild(raw):
+    data = main.apply_schema(raw)
+    dataset = main.Dataset.from_data(data)
+    expected = raw
+    # the first batch empties whole days and cube cells, the later ones revise what it left
+    first_day = data['date_of_arrest'].min()
+    batches = [(raw.iloc[:0], list(raw.loc[data['date_of_arrest'] == first_day, 'arrest_code']) + ['no such code'])]
+    for seed in (11, 12, 13):
+        added = arrests(100, seed, first_code=10000 * seed)
+        revised = raw.iloc[seed * 100:seed * 100 + 40].assign(arrest_res='JAIL', arrestee_home_city='URBANA')
+        batches.append((pd.concat([added, revised], ignore_index=True),
+                        list(raw['arrest_code'].iloc[seed * 150:seed * 150 + 20])))
+    for rows, deleted in batches:
+        dataset = dataset.apply_delta(main.apply_schema(rows), deleted)
+        expected = expected_rows(expected, rows, deleted)
+    rebuilt = main.Dataset.from_data(main.apply_schema(expected))
+    assert_same_cube(dataset.cube, rebuilt.cube)
+    for dims in main.CUBE_TABLES:
+        table = dataset.cube.table(dims)
+        assert not table[list(dims)].duplicated().any(), dims
+        assert (table['count'] != 0).all(), dims
+    assert_same_dates(dataset.dates, rebuilt.dates)
+    assert dataset.dates.first() > first_day
+
+
+def test_dataset_delta_of_unchanged_rows_is_a_no_op(raw):
+    dataset = main.Dataset.from_data(main.apply_schema(raw))
+    assert dataset.apply_delta(main.apply_schema(raw.iloc[100:150])) is dataset
+
+
+def test_snapshot_segments_read_back_as_the_updated_rows(raw, tmp_path):
+    cache_dir = str(tmp_path)
+    data = main.apply_schema(raw)
+    main.write_snapshot(data, cache_dir)
+    expected = data
+    for seed in (7, 8):
+        rows = main.apply_schema(arrests(40, seed, first_code=seed * 10000))
+        deleted = list(expected['arrest_code'].iloc[seed * 10:seed * 10 + 5])
+        expected = main.concat_categorical([expected[~expected['arrest_code'].isin(deleted)], rows])
+        meta = main.append_snapshot(rows, deleted, expected, cache_dir)
+        assert meta['rows'] == len(data)
+    assert len(meta['segments']) == 2
+    assert meta['high_water_mark'] == main.high_water_mark(expected)
+    pd.testing.assert_frame_equal(sorted_rows(main.apply_schema(main.read_snapshot(cache_dir))),
+                                  sorted_rows(expected), check_dtype=False)
+
+
+def test_snapshot_is_rewritten_once_segments_outgrow_it(raw, tmp_path):
+    cache_dir = str(tmp_path)
+    data = main.apply_schema(raw.iloc[:100])
+    main.write_snapshot(data, cache_dir)
+    rows = main.apply_schema(arrests(30, 9, first_code=50000))
+    expected = main.concat_categorical([data, rows])
+    meta = main.append_snapshot(rows, [], expected, cache_dir)
+    assert meta['segments'] == [] and meta['rows'] == 130
+    assert not list(tmp_path.glob('arrests-*.arrow'))
+    assert len(main.read_snapshot(cache_dir)) == 130
@@ -0,0 +1,88 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import main
+from test_cube import arrests
+
+CHARTS = list(main.FIGURES) + ['date_trend']
+
+
+@pytest.fixture(scope='module')
+def dataset():
+    return main.Dataset.from_data(main.apply_schema(arrests(2000, 3)))
+
+
+@pytest.fixture(scope='module')
+def exported(dataset, tmp_path_factory):
+    main.brotli, brotli = None, main.brotli
+    site = str(tmp_path_factory.mktemp('site'))
+    try:
+        assert main.export_site(dataset, site, 2, os.path.join(site, 'cache'))['built'] == CHARTS
+    finally:
+        main.brotli = brotli
+    return site
+
+
+@pytest.fixture
+def site(exported, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'brotli', None)
+    path = str(tmp_path / 'site')
+    shutil.copytree(exported, path)
+    return path
+
+
+def export(dataset, site):
+    return main.export_site(dataset, site, 2, os.path.join(site, 'cache'))
+
+
+def manifest(site):
+    with open(os.path.join(site, 'manifest.json')) as f:
+        return json.load(f)
+
+
+def test_export_skips_every_chart_when_nothing_changed(dataset, site):
+    assert export(dataset, site) == {'built': [], 'skipped': CHARTS}
+
+
+def test_export_rebuilds_only_the_charts_whose_rollups_changed(dataset, site):
+    row = dataset.data[dataset.data['arrest_res'] == 'JAIL'].iloc[[0]].assign(arrest_res='BOND')
+    before = manifest(site)
+    result = export(dataset.apply_delta(row), site)
+    assert set(result['built']) == {name for name, entry in before.items()
+                                    if any('arrest_res' in dims for dims in entry['reads'])}
+    assert set(result['built']) == {'case_res', 'plot_fig2', 'age_resolution'}
+    after = manifest(site)
+    for name in result['skipped']:
+        assert after[name] == before[name]
+    for name in result['built']:
+        assert os.path.exists(os.path.join(site, after[name]['figure']))
+        assert not os.path.exists(os.path.join(site, before[name]['figure']))
+
+
+@pytest.mark.parametrize('key', ['figure', 'template'])
+def test_export_rebuilds_charts_whose_files_are_gone(dataset, site, key):
+    entry = manifest(site)['case_res']
+    os.remove(os.path.join(site, entry[key]))
+    result = export(dataset, site)
+    # every chart shares the template
+    assert result['built'] == (['case_res'] if key == 'figure' else CHARTS)
+    assert os.path.exists(os.path.join(site, entry[key]))
+
+
+def test_export_prunes_assets_no_page_refers_to(dataset, site):
+    stale = [os.path.join(site, 'figures', 'case_res-0000000000.json'),
+             os.path.join(site, 'figures', 'case_res-0000000000.json.gz'),
+             os.path.join(site, 'plotly-0000000000.min.js'),
+             os.path.join(site, 'plotly-0000000000.min.js.gz')]
+    for path in stale:
+        with open(path, 'w') as f:
+            f.write('{}')
+    export(dataset, site)
+    assert not any(os.path.exists(path) for path in stale)
+    used = {os.path.basename(entry[key]) for entry in manifest(site).values() for key in ['figure', 'template']}
+    left = {name.split('.json')[0] + '.json' for name in os.listdir(os.path.join(site, 'figures'))}
+    assert left == used
+    assert len([name for name in os.listdir(site) if name.endswith('.min.js')]) == 1
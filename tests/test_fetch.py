@@ -0,0 +1,172 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import pytest
+
+import benchmark
+import main
+
+
+class StandIn:
+    """
+    Stand-in for the Socrata CSV endpoint: answers $select (columns or count(*)),
+    $where on date_of_arrest, $order, $limit and $offset, fails the first
+    requests with the configured status and cuts the body of the first truncated
+    pages in half
+    """
+
+    def __init__(self, rows, failures=0, status=503, truncated=0):
+        self.rows = rows
+        self.failures = failures
+        self.status = status
+        self.truncated = truncated
+        self.requests = []
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.handler())
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = 'http://127.0.0.1:%d/resource.csv' % self.server.server_address[1]
+
+    def handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+                with stand_in._lock:
+                    stand_in.requests.append(query)
+                    failing = stand_in.failures > 0
+                    stand_in.failures -= 1
+                if failing:
+                    self.send_response(stand_in.status)
+                    self.end_headers()
+                    return
+                with stand_in._lock:
+                    cut = '$offset' in query and stand_in.truncated > 0
+                    stand_in.truncated -= cut
+                self.reply(stand_in.answer(query), cut)
+
+            def reply(self, frame, cut=False):
+                body = frame.to_csv(index=False).encode()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if cut:
+                    # the connection drops half way through the promised body
+                    self.wfile.write(body[:len(body) // 2])
+                    self.close_connection = True
+                    return
+                self.wfile.write(body)
+
+        return Handler
+
+    def answer(self, query):
+        rows = self.rows
+        if '$where' in query:
+            rows = rows[rows['date_of_arrest'] >= query['$where'].split("'")[1]]
+        if query['$select'] == 'count(*) AS total':
+            return pd.DataFrame({'total': [len(rows)]})
+        rows = rows.sort_values(query['$order'])[query['$select'].split(',')]
+        offset = int(query['$offset'])
+        return rows.iloc[offset:offset + int(query['$limit'])]
+
+    def pages(self):
+        return [query for query in self.requests if '$offset' in query]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def source_rows(n, seed=0):
+    data = benchmark.synthetic_arrests(n, seed)
+    data['date_of_arrest'] = data['date_of_arrest'].dt.strftime('%Y-%m-%dT%H:%M:%S.000')
+    return data.rename(columns={target: source for source, target in main.COLUMNS.items()})
+
+
+@pytest.fixture
+def stand_in():
+    servers = []
+
+    def start(n, seed=0, **kwargs):
+        server = StandIn(source_rows(n, seed), **kwargs)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(main.time, 'sleep', lambda seconds: None)
+
+
+def fetched_codes(pages):
+    return pd.concat(pages, ignore_index=True)['arrest_code'].tolist()
+
+
+@pytest.mark.parametrize('n', [0, 7, 30, 95])
+def test_fetch_records_requests_only_the_counted_pages(stand_in, n):
+    server = stand_in(n)
+    pages = main.fetch_records(server.url, page_size=10, max_workers=4)
+    assert fetched_codes(pages) == sorted(server.rows['arrest_code'])
+    # one count, the pages holding the rows, and one more when the last page is full
+    assert len(server.requests) == 1 + n // 10 + 1
+    assert sorted(int(query['$offset']) for query in server.pages()) == list(range(0, n // 10 * 10 + 1, 10))
+
+
+def test_fetch_records_where_filters_the_count_and_every_page(stand_in):
+    server = stand_in(60)
+    mark = sorted(server.rows['date_of_arrest'])[45]
+    where = "date_of_arrest >= '%s'" % mark
+    pages = main.fetch_records(server.url, where=where, page_size=10)
+    expected = server.rows[server.rows['date_of_arrest'] >= mark]['arrest_code']
+    assert fetched_codes(pages) == sorted(expected)
+    assert all(query['$where'] == where for query in server.requests)
+    assert len(server.pages()) == 2
+
+
+def test_fetch_records_retries_server_errors(stand_in, no_backoff):
+    server = stand_in(25, failures=3)
+    pages = main.fetch_records(server.url, page_size=10, max_workers=2)
+    assert fetched_codes(pages) == sorted(server.rows['arrest_code'])
+    assert len(server.requests) == 3 + 1 + 3
+
+
+def test_fetch_records_retries_rate_limits(stand_in, no_backoff):
+    server = stand_in(5, failures=2, status=429)
+    assert len(pd.concat(main.fetch_records(server.url, page_size=10))) == 5
+
+
+def test_fetch_records_retries_bodies_cut_short(stand_in, no_backoff):
+    server = stand_in(25, truncated=2)
+    pages = main.fetch_records(server.url, page_size=10, max_workers=2)
+    assert fetched_codes(pages) == sorted(server.rows['arrest_code'])
+    assert len(server.pages()) == 3 + 2
+
+
+def test_fetch_page_raises_a_requests_error_for_a_body_cut_short_every_time(stand_in, no_backoff):
+    server = stand_in(25, truncated=10)
+    with main.make_session() as session, pytest.raises(main.requests.RequestException):
+        main.fetch_page(session, server.url, 0, 10, retries=2)
+    assert len(server.pages()) == 3
+
+
+def test_fetch_page_gives_up_after_the_last_retry(stand_in, no_backoff):
+    server = stand_in(5, failures=10)
+    with main.make_session() as session, pytest.raises(main.requests.HTTPError):
+        main.fetch_page(session, server.url, 0, 10, retries=2)
+    assert len(server.requests) == 3
+
+
+def test_fetch_page_does_not_retry_client_errors(stand_in, no_backoff):
+    server = stand_in(5, failures=1, status=404)
+    with main.make_session() as session, pytest.raises(main.requests.HTTPError):
+        main.fetch_page(session, server.url, 0, 10)
+    assert len(server.requests) == 1
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+import benchmark
+import main
+
+ANIMATED = [name for name, (heading, builder, style, dim) in main.FIGURES.items() if dim]
+
+
+@pytest.fixture(scope='module')
+def cube():
+    return main.CountCube.from_data(main.apply_schema(benchmark.synthetic_arrests(5000, 4)))
+
+
+@pytest.fixture(scope='module')
+def dataset():
+    return main.Dataset.from_data(main.apply_schema(benchmark.synthetic_arrests(20000, 1)))
+
+
+def colors(figure):
+    traces = list(figure.data) + [trace for frame in figure.frames for trace in frame.data]
+    return {trace.name: trace.marker.color if trace.type == 'bar' else trace.line.color for trace in traces}
+
+
+@pytest.mark.parametrize('name', ANIMATED)
+def test_single_frames_keep_the_layout_of_the_full_animation(cube, name):
+    heading, builder, style, dim = main.FIGURES[name]
+    full = builder(cube)
+    for frame in list(cube.rollup([dim])[dim])[::7]:
+        single = builder(cube, frame=frame)
+        assert single.layout.yaxis.range == full.layout.yaxis.range
+        assert single.layout.xaxis.categoryarray == full.layout.xaxis.categoryarray
+        assert single.layout.legend.traceorder == full.layout.legend.traceorder
+        full_colors = colors(full)
+        assert all(full_colors[trace] == color for trace, color in colors(single).items())
+
+
+@pytest.mark.parametrize('params', [
+    (('year_of_arrest', (1988, 1988)), ('arrest_res', ('NOTICE TO APPEAR',)), ('arrestee_race', ('BLACK',))),
+    (('year_of_arrest', (1990, 1992)), ('crime_category_desc', ('CATEGORY 07',))),
+    (('arrestee_sex', ('NO SUCH VALUE',)),),
+])
+def test_every_figure_renders_on_a_filtered_cube(dataset, params):
+    cube = dataset.cube_for(params)
+    for name, (heading, builder, style, dim) in main.FIGURES.items():
+        builder(cube).to_json()
+        if dim is not None and len(cube.rollup([dim])):
+            builder(cube, frame=cube.rollup([dim])[dim].iloc[0]).to_json()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = main.FigureStore(str(tmp_path), max_bytes=64 * 1024)
+    monkeypatch.setattr(main, 'figure_store', store)
+    return store
+
+
+@pytest.mark.parametrize('accept, etag', [('identity', '"%s"'), ('gzip', '"%s-gzip"')])
+def test_figure_etags_name_the_encoding_and_any_of_them_revalidates(store, accept, etag):
+    digest = store.put('{"data": []}')
+
+    def get(headers):
+        # the view alone, the dash app would lay out the dashboard on its first request
+        with main.app.server.test_request_context('/figures/%s.json' % digest, headers=headers):
+            return main.serve_figure(digest)
+
+    response = get({'Accept-Encoding': accept})
+    assert response.status_code == 200
+    assert response.headers['ETag'] == etag % digest
+    for held in [digest, digest + '-gzip', digest + '-br']:
+        response = get({'Accept-Encoding': accept, 'If-None-Match': '"%s"' % held})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag % digest
+
+
+def test_figure_store_prunes_as_it_is_written(store):
+    for n in range(200):
+        store.put(json_figure(n))
+    total = sum(os.path.getsize(os.path.join(store.root, name)) for name in os.listdir(store.root))
+    assert total <= store.max_bytes * 9 / 8
+    assert os.path.exists(store.path(store.put(json_figure(199))))
+
+
+def json_figure(n):
+    return '{"data": [%s]}' % ','.join(str((n * 7919 + i * 104729) % 1000003) for i in range(300))
+
+
+def test_prebuild_warms_the_frames_show_figure_asks_for(dataset, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'shared_store', None)
+    monkeypatch.setattr(main, '_dataset', dataset)
+    monkeypatch.setattr(main, 'figure_cache', main.FigureCache())
+    names = ['cat1_arrests', 'arrests_by_sex', 'plot_fig1']
+    built = main.prebuild_figures(dataset, names, max_workers=2, cache_dir=str(tmp_path))
+    frames = main.frame_values('cat1_arrests')
+    assert set(built) == {('plot_fig1', None)} | {(name, frame) for name in names[:2] for frame in frames}
+    for (name, frame), text in built.items():
+        key = (name, (), frame, dataset.version)
+        assert main.figure_cache.get(key) == text
+        builder = main.FIGURES[name][1]
+        expected = builder(dataset.cube) if frame is None else builder(dataset.cube, frame=frame)
+        assert text == expected.to_json()
+
+
+def test_prebuild_without_frames_builds_whole_animations_uncached(dataset, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'figure_cache', main.FigureCache())
+    built = main.prebuild_figures(dataset, ['cat2_arrests'], max_workers=1, cache_dir=str(tmp_path), frames=False)
+    assert built == {('cat2_arrests', None): main.cat2_arrests(dataset.cube).to_json()}
+    assert main.figure_cache.size == 0
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+from test_cube import arrests
+
+
+@pytest.fixture(scope='module')
+def data():
+    return main.apply_schema(arrests(6000, 7))
+
+
+def mask_ids(data, params):
+    mask = np.ones(len(data), dtype=bool)
+    for col, values in params:
+        if col in main.RANGE_COLUMNS:
+            low, high = values
+            mask &= ((data[col] >= low) & (data[col] <= high)).fillna(False).to_numpy(dtype=bool)
+        else:
+            mask &= data[col].isin(values).to_numpy(dtype=bool)
+    return np.flatnonzero(mask)
+
+
+@pytest.mark.parametrize('params', [
+    (('year_of_arrest', (1995, 2000)),),
+    (('year_of_arrest', (2024, 2024)),),
+    (('arrestee_race', ('BLACK', 'ASIAN')),),
+    (('year_of_arrest', (1990, 2010)), ('arrestee_sex', ('FEMALE',))),
+    (('arrest_res', ('JAIL', 'BOND', 'RELEASED')), ('arrestee_race', ('WHITE', 'HISPANIC')),
+     ('crime_category_desc', ('CATEGORY 00', 'CATEGORY 03'))),
+    (('year_of_arrest', (1988, 2024)), ('arrestee_sex', ('MALE', 'FEMALE', 'UNKNOWN'))),
+    (('arrestee_sex', ('NO SUCH VALUE',)),),
+    (('year_of_arrest', (2030, 2040)), ('arrestee_race', ('BLACK',))),
+    (('year_of_arrest', (1995, 1996)), ('arrestee_race', ('NATIVE AMERICAN',)), ('arrestee_sex', ('UNKNOWN',))),
+])
+def test_select_matches_boolean_masks(data, params):
+    ids = main.RowIndex.from_data(data).select(params)
+    expected = mask_ids(data, params)
+    assert ids.tolist() == expected.tolist()
+
+
+def test_select_without_params_filters_nothing(data):
+    assert main.RowIndex.from_data(data).select(()) is None
+
+
+def expected_trend(data, start, end, freq, window):
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    shown = data[(data['date_of_arrest'] >= start) & (data['date_of_arrest'] < end.normalize() + pd.Timedelta(days=1))]
+    periods = pd.period_range(start, end, freq=freq)
+    grouped = shown.groupby(shown['date_of_arrest'].dt.to_period(freq))['age_at_arrest'].agg(['size', 'mean'])
+    grouped = grouped.reindex(periods)
+    arrests = grouped['size'].fillna(0)
+    return pd.DataFrame({
+        'period': periods.start_time.where(periods.start_time > start, start),
+        'arrests': arrests.to_numpy(),
+        'rolling_arrests': arrests.rolling(window, min_periods=1).mean().to_numpy(),
+        'mean_age': grouped['mean'].to_numpy(dtype=float),
+    })
+
+
+@pytest.mark.parametrize('freq, window', [('D', 1), ('D', 7), ('W', 1), ('W', 4), ('M', 1), ('M', 3)])
+@pytest.mark.parametrize('start, end', [('1995-03-17', '1996-11-04'), ('2001-01-01', '2001-01-31'),
+                                        ('1987-06-01', '1988-02-10'), ('2024-12-30', '2025-02-01')])
+def test_resample_matches_a_groupby_on_periods(data, freq, window, start, end):
+    trend = main.DateIndex.from_data(data).resample(start, end, freq, window)
+    expected = expected_trend(data, start, end, freq, window)
+    assert trend['period'].tolist() == expected['period'].tolist()
+    np.testing.assert_array_equal(trend['arrests'], expected['arrests'])
+    np.testing.assert_allclose(trend['rolling_arrests'], expected['rolling_arrests'])
+    np.testing.assert_allclose(trend['mean_age'], expected['mean_age'])
+
+
+def test_date_trend_plots_the_resampled_counts(data):
+    figure = main.date_trend(main.DateIndex.from_data(data), '1995-03-17', '1997-05-02', 'W', 4)
+    expected = expected_trend(data, '1995-03-17', '1997-05-02', 'W', 4)
+    traces = {trace.name: trace for trace in figure.data}
+    assert set(traces) == {'arrests', 'rolling_arrests'}
+    for name, trace in traces.items():
+        assert list(pd.to_datetime(trace.x)) == expected['period'].tolist()
+        np.testing.assert_allclose(np.asarray(trace.y, dtype=float), expected[name])
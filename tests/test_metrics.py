@@ -0,0 +1,42 @@
+import time
+
+import numpy as np
+import pytest
+
+import main
+
+MB = 2 ** 20
+
+
+def allocate(size):
+    data = np.ones(size // 8)
+    # numpy fills the array holding the GIL, give the sampler a turn before it is freed
+    time.sleep(0.05)
+    return data
+
+
+def growth(stage):
+    return main.metrics._counters.get(('arrests_stage_peak_rss_growth_bytes_total', (('stage', stage),)), 0)
+
+
+@pytest.mark.skipif(main.current_rss() is None, reason='needs /proc')
+def test_stage_rss_growth_is_sampled_rather_than_the_lifetime_peak():
+    with main.measured('test_big'):
+        big = allocate(256 * MB)
+        del big
+    with main.measured('test_small'):
+        small = allocate(64 * MB)
+        del small
+    # the lifetime peak never moves during the smaller stage
+    assert growth('test_big') > 200 * MB
+    assert 48 * MB < growth('test_small') < 200 * MB
+
+
+@pytest.mark.skipif(main.current_rss() is None, reason='needs /proc')
+def test_nested_stages_each_keep_their_peak():
+    with main.measured('test_outer'):
+        with main.measured('test_inner'):
+            data = allocate(64 * MB)
+            del data
+    assert growth('test_inner') > 48 * MB
+    assert growth('test_outer') > 48 * MB
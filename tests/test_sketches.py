@@ -0,0 +1,121 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+import main
+from test_fetch import StandIn, source_rows
+
+
+def chunks(data, size):
+    return [data.iloc[start:start + size] for start in range(0, len(data), size)]
+
+
+def assert_space_saving_bounds(heavy, values):
+    truth = values.value_counts()
+    truth = truth[truth > 0]
+    for key, estimate in heavy.counts.items():
+        assert estimate >= truth.get(key, 0), key
+        assert estimate - heavy.errors[key] <= truth.get(key, 0), key
+    untracked = truth[~truth.index.isin(heavy.counts.index)]
+    assert (untracked <= heavy.floor).all()
+    assert len(heavy.counts) <= heavy.capacity
+
+
+@pytest.fixture(scope='module')
+def data():
+    return main.apply_schema(benchmark.synthetic_arrests(20000, 3))
+
+
+@pytest.mark.parametrize('capacity, size', [(10, 1000), (50, 3000), (500, 20000)])
+def test_space_saving_never_undercounts_and_bounds_the_overcount(data, capacity, size):
+    for col in main.SKETCH_COLUMNS:
+        heavy = main.SpaceSaving(capacity)
+        for chunk in chunks(data, size):
+            heavy.update(chunk[col])
+        assert heavy.total == data[col].count()
+        assert_space_saving_bounds(heavy, data[col])
+
+
+def test_space_saving_merge_keeps_the_bounds(data):
+    left, right = main.SpaceSaving(20), main.SpaceSaving(20)
+    for chunk in chunks(data.iloc[:12000], 2000):
+        left.update(chunk['arrestee_home_city'])
+    for chunk in chunks(data.iloc[12000:], 2000):
+        right.update(chunk['arrestee_home_city'])
+    left.merge(right.counts, right.errors, right.floor)
+    assert_space_saving_bounds(left, data['arrestee_home_city'])
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_median_bounds_hold_the_true_median_of_integer_ages(seed):
+    rng = np.random.default_rng(seed)
+    ages = np.round(rng.gamma(6.0, 5.0, 30000) + 12)
+    digest, merged = main.TDigest(), main.TDigest()
+    for part in np.array_split(ages, 7):
+        digest.update(part)
+        single = main.TDigest()
+        single.update(part)
+        merged.merge(single)
+    for sketch in (digest, merged):
+        low, median, high = sketch.quantile_bounds(0.5)
+        assert low <= np.median(ages) <= high
+        assert low <= median <= high
+
+
+def sketched(data, size=2500):
+    stream = main.SketchStream()
+    for chunk in chunks(data, size):
+        stream.update(chunk)
+    return stream.dataset()
+
+
+def test_age_digests_count_the_ages_of_their_bars(data, monkeypatch):
+    monkeypatch.setattr(main, 'TOP_N', 8)
+    dataset = sketched(data)
+    crimes = dataset.cube.rollup(['crime_code_desc'])
+    assert main.OTHER_LABEL in set(crimes['crime_code_desc'])
+    sketches = dataset.cube.sketches
+    for crime, age_count in zip(crimes['crime_code_desc'], crimes['age_count']):
+        digest = sketches.other_ages() if crime == main.OTHER_LABEL else sketches.ages[crime]
+        assert digest.count == age_count, crime
+
+
+def test_other_bounds_every_value_outside_the_top(data, monkeypatch):
+    monkeypatch.setattr(main, 'TOP_N', 8)
+    dataset = sketched(data)
+    for col in main.SKETCH_COLUMNS:
+        text = dataset.cube.sketches.bounds(col)[main.OTHER_LABEL]
+        most = int(re.search(r'at most (\d+)', text).group(1))
+        truth = data[col].value_counts()
+        outside = truth[~truth.index.isin(dataset.cube.sketches.kept(col))]
+        assert outside.max() <= most, col
+
+
+@pytest.mark.parametrize('name, col', [('city_sex', 'arrestee_home_city'), ('city_crime_type', 'arrestee_home_city'),
+                                       ('plot_fig1', 'crime_code_desc')])
+def test_sketch_figures_label_each_value_once_and_stay_smaller_than_exact_ones(data, name, col):
+    dataset = sketched(data)
+    builder = main.FIGURES[name][1]
+    figure = builder(dataset.cube)
+    bounds = dataset.cube.sketches.bounds(col)
+    axis = figure.layout.xaxis
+    assert len(set(axis.tickvals)) == len(axis.tickvals) > 0
+    assert list(axis.ticktext) == ['%s<br>%s' % (value, bounds[value]) for value in axis.tickvals]
+    assert len(figure.to_json()) < len(builder(main.CountCube.from_data(data)).to_json())
+
+
+def test_streaming_load_counts_every_row(tmp_path):
+    server = StandIn(source_rows(3000, 2))
+    try:
+        dataset = main.load_sketched(server.url, cache_dir=str(tmp_path))
+        again = main.load_sketched(server.url, cache_dir=str(tmp_path))
+    finally:
+        server.close()
+    assert dataset.data is None and not dataset.filterable
+    for dims in main.CUBE_TABLES:
+        assert dataset.cube.table(dims)['count'].sum() == 3000, dims
+    assert dataset.dates.count(pd.Timestamp('1900-01-01'), pd.Timestamp('2100-01-01')) == 3000
+    assert again.version == dataset.version
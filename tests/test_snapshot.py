@@ -0,0 +1,78 @@
+import os
+
+import pandas as pd
+import pytest
+
+import main
+from test_fetch import source_rows, stand_in, no_backoff  # noqa: F401
+
+pytest.importorskip('pyarrow')
+
+
+def later_rows(server, n):
+    """
+    Source rows dated after every row the server holds, plus a revised copy of its newest
+    """
+    added = source_rows(n, 9).assign(arrest_code=['9%07d' % code for code in range(n)],
+                                     date_of_arrest='2025-03-01T00:00:00.000', year_of_arrest=2025)
+    newest = server.rows.sort_values('date_of_arrest').iloc[[-1]].assign(arrest_resolution='BOND')
+    return pd.concat([added, newest], ignore_index=True)
+
+
+def served(server):
+    return sorted(server.rows['arrest_code'])
+
+
+def test_get_data_fetches_once_and_reads_the_fresh_snapshot(stand_in, tmp_path):
+    server = stand_in(300, 1)
+    data = main.get_data(server.url, cache_dir=str(tmp_path))
+    requests = len(server.requests)
+    again = main.get_data(server.url, cache_dir=str(tmp_path))
+    assert len(server.requests) == requests
+    assert sorted(again['arrest_code']) == sorted(data['arrest_code']) == served(server)
+    assert main.read_meta(str(tmp_path))['rows'] == 300
+
+
+def test_get_data_tops_a_stale_snapshot_up_with_a_segment(stand_in, tmp_path):
+    server = stand_in(300, 1)
+    main.get_data(server.url, cache_dir=str(tmp_path))
+    snapshot = os.path.join(str(tmp_path), main.SNAPSHOT_FILE)
+    written = os.stat(snapshot).st_mtime_ns
+    mark = main.read_meta(str(tmp_path))['high_water_mark']
+    changed = later_rows(server, 5)
+    server.rows = pd.concat([server.rows[~server.rows['arrest_code'].isin(changed['arrest_code'])], changed],
+                            ignore_index=True)
+    server.requests.clear()
+    data = main.get_data(server.url, ttl=0, cache_dir=str(tmp_path))
+    assert all(query.get('$where') == "date_of_arrest >= '%s'" % mark for query in server.requests)
+    assert sorted(data['arrest_code']) == served(server)
+    assert data.loc[data['arrest_code'] == server.rows['arrest_code'].iloc[-1], 'arrest_res'].tolist() == ['BOND']
+    meta = main.read_meta(str(tmp_path))
+    assert os.stat(snapshot).st_mtime_ns == written
+    assert len(meta['segments']) == 1
+    assert meta['high_water_mark'] == '2025-03-01T00:00:00.000'
+    reread = main.get_data(server.url, offline=True, cache_dir=str(tmp_path))
+    assert sorted(reread['arrest_code']) == served(server)
+
+
+def test_get_data_offline_without_a_snapshot_fails(stand_in, tmp_path):
+    server = stand_in(10)
+    with pytest.raises(RuntimeError):
+        main.get_data(server.url, offline=True, cache_dir=str(tmp_path))
+    assert server.requests == []
+
+
+def test_get_data_serves_a_stale_snapshot_while_the_api_fails(stand_in, no_backoff, tmp_path):
+    server = stand_in(120, 2)
+    main.get_data(server.url, cache_dir=str(tmp_path))
+    fetched_at = main.read_meta(str(tmp_path))['fetched_at']
+    server.failures = 1000
+    data = main.get_data(server.url, ttl=0, cache_dir=str(tmp_path))
+    assert sorted(data['arrest_code']) == served(server)
+    assert main.read_meta(str(tmp_path))['fetched_at'] == fetched_at
+
+
+def test_get_data_without_a_snapshot_raises_while_the_api_fails(stand_in, no_backoff, tmp_path):
+    server = stand_in(10, failures=1000)
+    with pytest.raises(main.requests.RequestException):
+        main.get_data(server.url, cache_dir=str(tmp_path))
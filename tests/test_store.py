@@ -0,0 +1,106 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import main
+from test_cube import arrests, assert_same_cube
+from test_fetch import stand_in  # noqa: F401
+from test_snapshot import later_rows
+
+pytest.importorskip('pyarrow')
+
+PARAMS = [
+    (('year_of_arrest', (1995, 2005)),),
+    (('year_of_arrest', (1990, 2010)), ('arrestee_race', ('BLACK', 'ASIAN')), ('arrestee_sex', ('FEMALE',))),
+    (('arrest_res', ('JAIL', 'BOND')), ('crime_category_desc', ('CATEGORY 01',))),
+    (('arrestee_sex', ('NO SUCH VALUE',)),),
+]
+
+
+@pytest.fixture
+def dataset():
+    return main.Dataset.from_data(main.apply_schema(arrests(4000, 8)))
+
+
+def assert_same_dates(dates, expected):
+    for name in ['dates', 'counts', 'age_sum', 'age_count']:
+        np.testing.assert_array_equal(getattr(dates, name), getattr(expected, name))
+
+
+def test_publish_attach_round_trip(dataset, tmp_path):
+    store = main.SharedStore(str(tmp_path))
+    store.publish(dataset)
+    attached = store.attach()
+    assert store.current() == attached.version == dataset.version
+    assert attached.filterable
+    assert_same_cube(attached.cube, dataset.cube)
+    assert_same_dates(attached.dates, dataset.dates)
+    for col in main.FILTER_COLUMNS:
+        assert attached.values(col) == dataset.values(col)
+
+
+@pytest.mark.parametrize('params', PARAMS)
+def test_filtered_queries_on_an_attached_dataset(dataset, tmp_path, params):
+    store = main.SharedStore(str(tmp_path))
+    store.publish(dataset)
+    attached = store.attach()
+    np.testing.assert_array_equal(attached.index.select(params), dataset.index.select(params))
+    assert_same_cube(attached.cube_for(params), dataset.cube_for(params))
+    assert_same_dates(attached.dates_for(params), dataset.dates_for(params))
+
+
+def test_publish_keeps_the_previous_version_only(dataset, tmp_path):
+    store = main.SharedStore(str(tmp_path))
+    versions = [dataset]
+    for first_code in [4000, 4100]:
+        versions.append(versions[-1].apply_delta(main.apply_schema(arrests(100, first_code, first_code))))
+    for version in versions:
+        store.publish(version)
+    assert store.current() == versions[2].version
+    previous = store.attach(versions[1].version)
+    assert_same_cube(previous.cube, versions[1].cube)
+    assert not os.path.exists(os.path.join(store.root, versions[0].version))
+    with pytest.raises(FileNotFoundError):
+        store.attach(versions[0].version)
+
+
+def test_refresh_publishes_once_and_applies_upstream_changes(stand_in, tmp_path, monkeypatch):
+    server = stand_in(400, 3)
+    store = main.SharedStore(str(tmp_path))
+    first = store.refresh(server.url)
+    requests = len(server.requests)
+    assert store.refresh(server.url) == first
+    assert len(server.requests) == requests
+    changed = later_rows(server, 6)
+    server.rows = pd.concat([server.rows[~server.rows['arrest_code'].isin(changed['arrest_code'])], changed],
+                            ignore_index=True)
+    monkeypatch.setattr(main, 'CACHE_TTL', 0)
+    second = store.refresh(server.url)
+    assert second != first
+    assert os.path.isdir(os.path.join(store.root, first))
+    attached = store.attach()
+    assert attached.version == second
+    assert attached.cube.rollup(['year_of_arrest'])['count'].sum() == len(server.rows)
+    expected = main.Dataset.from_data(main.get_data(server.url, offline=True, cache_dir=str(tmp_path)))
+    assert_same_cube(attached.cube, expected.cube)
+
+
+def test_follow_store_attaches_new_versions_and_skips_removed_ones(dataset, tmp_path, monkeypatch):
+    store = main.SharedStore(str(tmp_path))
+    store.publish(dataset)
+    monkeypatch.setattr(main, 'shared_store', store)
+    monkeypatch.setattr(main, '_dataset', store.attach())
+    monkeypatch.setattr(main, '_store_checked', 0)
+    monkeypatch.setattr(main, 'STORE_POLL', 0)
+    updated = dataset.apply_delta(main.apply_schema(arrests(50, 4000, 4000)))
+    store.publish(updated)
+    main.follow_store()
+    assert main._dataset.version == updated.version
+    # CURRENT names a version whose directory is gone
+    with open(os.path.join(store.root, 'CURRENT'), 'w') as f:
+        f.write('0' * 16)
+    main.follow_store()
+    assert main._dataset.version == updated.version
+    assert main._store_checked == 0